@@ -1,13 +1,18 @@
 from .issues.source_issues import SourceIssue
 from .issues.source_volume_issues import SourceVolumeIssue
 from .issues.feed_issues import FeedIssue
-from .classes import SourcePayload, SourceVolumePayload, CollectionPayload, FeedPayload
+from .classes import SourcePayload, SourceVolumePayload, CollectionPayload, FeedPayload, payloads_to_frame
 from .clients.zammad_client import ZammadClient
-from collections import defaultdict
+from .clients.mediacloud_client import MediaCloudClients
+from .concurrency import HostRateLimiter, ordered_map
+from .cache import ResponseCache, SQLiteResponseCache
+from collections import Counter, defaultdict
 import datetime as dt 
+import hashlib
+import json
+import threading
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic_settings import BaseSettings
-import mediacloud.api as mc_api
 import logging
 
 logging.basicConfig(level=logging.ERROR)
@@ -25,12 +30,51 @@ jinja_env = Environment(
 
 class Config(BaseSettings):
     mc_api_token:str|None=None
+    #Root of the directory and search api, None for the public one
+    mc_base_url:str|None=None
     #No collections should have more than this many sources
     # so just set it high so we don't have to worry about paging. 
     mc_api_limit:int=10000 
+    #Number of sources hydrated in parallel when building a Collection
+    mc_max_workers:int=8
+    #Max requests per second sent to any one api host, None or 0 (the default) disables the limit
+    mc_requests_per_second:float|None=None
+    #Keep-alive connections held open to the api, should be at least mc_max_workers
+    mc_pool_size:int=16
+    #Seconds before an api request is abandoned
+    mc_timeout:float=60
+    #Local cache of api responses, so repeated triage runs don't re-download the same metadata
+    mc_cache_enabled:bool=False
+    mc_cache_path:str="/tmp/directory_issues/mc_api_cache.db"
+    mc_cache_max_entries:int=100000
+    #Seconds to keep responses, by endpoint prefix
+    mc_cache_ttls:dict[str, float]={"sources/": 6 * 3600, "search/": 3600}
+    #Skip the cache entirely (neither read nor written) while leaving it configured
+    mc_cache_bypass:bool=False
 
 config = Config()
 
+api_rate_limiter = HostRateLimiter(config.mc_requests_per_second)
+
+if config.mc_cache_enabled:
+    api_cache = SQLiteResponseCache(
+        config.mc_cache_path,
+        max_entries=config.mc_cache_max_entries,
+        ttls=config.mc_cache_ttls,
+        bypass=config.mc_cache_bypass)
+else:
+    api_cache = None
+
+#Shared by everything in this module, use mc_clients.directory() / mc_clients.search()
+#rather than constructing new mc_api clients
+mc_clients = MediaCloudClients(
+    config.mc_api_token,
+    pool_size=config.mc_pool_size,
+    timeout=config.mc_timeout,
+    rate_limiter=api_rate_limiter,
+    cache=api_cache,
+    base_url=config.mc_base_url)
+
 
 try:
     zammad_client = ZammadClient()
@@ -39,6 +83,151 @@ except:
     zammad_client = None
 
 
+class MembershipIndex():
+    """
+    Reverse index answering "which collections is source X in" without a collection_list call per source. 
+    Built once from paged source_list calls over a set of collections (or loaded from a saved dump), 
+    so only collections that have been added to the index are ever reported.
+
+    Sources and Collections only answer membership from an index which is complete, i.e. built by
+    from_collection_ids (or loaded from a dump of one), which pages through every source of each collection.
+    """
+
+    @classmethod
+    def from_collection_ids(cls, collection_ids:list[int], page_size:int = 1000):
+        index = MembershipIndex()
+        mc_client = mc_clients.directory()
+        for collection_id in collection_ids:
+            collection = mc_client.collection(collection_id)
+            index.add_collection(collection, cls.fetch_source_ids(mc_client, collection_id, page_size))
+        index.complete = True
+        return index
+
+    @staticmethod
+    def fetch_source_ids(mc_client, collection_id:int, page_size:int = 1000):
+        source_ids = []
+        offset = 0
+        while True:
+            response = mc_client.source_list(collection_id=collection_id, limit=page_size, offset=offset)
+            source_ids += [s["id"] for s in response["results"]]
+            if response["next"] is None or len(response["results"]) == 0:
+                break
+            offset += len(response["results"])
+        return source_ids
+
+    @classmethod
+    def load(cls, path:str):
+        with open(path, 'r') as f:
+            dump = json.load(f)
+        index = MembershipIndex()
+        for entry in dump["collections"]:
+            index.add_collection(entry["collection"], entry["source_ids"])
+        index.complete = dump.get("complete", False)
+        return index
+
+    def __init__(self):
+        #Whether the index holds every source of its collections, see from_collection_ids
+        self.complete = False
+        self._lock = threading.Lock()
+        self._collections = {}
+        self._members = defaultdict(list)
+        self._by_source = defaultdict(list)
+
+    def __repr__(self):
+        return f"MembershipIndex({len(self._collections)} collections, {len(self._by_source)} sources)"
+
+    def __contains__(self, collection_id:int):
+        return collection_id in self._collections
+
+    def add_collection(self, collection:dict, source_ids:list[int]):
+        with self._lock:
+            if collection["id"] in self._collections:
+                return
+            self._collections[collection["id"]] = collection
+            self._members[collection["id"]] = list(source_ids)
+            for source_id in source_ids:
+                self._by_source[source_id].append(collection)
+
+    def collections_for(self, source_id:int) -> list[dict]:
+        return list(self._by_source.get(source_id, []))
+
+    def save(self, path:str):
+        dump = {
+            "timestamp": dt.datetime.now().isoformat(),
+            "complete": self.complete,
+            "collections": [{"collection": c, "source_ids": self._members[cid]} for cid, c in self._collections.items()]
+        }
+        with open(path, 'w') as f:
+            json.dump(dump, f)
+
+
+#Windows used for the source volume summaries
+RECENT_VOLUME_DAYS = 30
+TOTAL_VOLUME_DAYS = 365 * 10
+#The search api's per-source breakdown only returns this many sources per query
+VOLUME_BATCH_SIZE = 100
+
+
+def get_source_volumes(sources:list[SourcePayload], include_histograms:bool = True, 
+        batch_size:int = VOLUME_BATCH_SIZE, max_workers:int|None = None) -> dict[int, SourceVolumePayload]:
+    """
+    Volume summaries for many sources in two aggregated queries per batch of sources, 
+    instead of three queries per source. The per-source counts come from the search api's 
+    sources breakdown, which reports by canonical domain (the source name). Sources it can't 
+    speak for (those with a url_search_string, or missing from the breakdown) are counted 
+    with their own story_count queries instead.
+
+    There is no grouped count-over-time in the api, so when include_histograms is set the recent
+    histogram is still one query per source, only for sources with recent stories and run on 
+    max_workers threads. Sources with no recent stories get an empty histogram.
+    """
+    mc_client = mc_clients.search()
+    today = dt.date.today()
+    month_ago = today - dt.timedelta(days=RECENT_VOLUME_DAYS)
+    years_ago = today - dt.timedelta(days=TOTAL_VOLUME_DAYS)
+    workers = config.mc_max_workers if max_workers is None else max_workers
+
+    def counts_by_id(batch, start_date):
+        #A domain's count only belongs to a source which is that whole domain, and to just one source in the batch
+        names = Counter(s.name.lower() for s in batch if s.name)
+        ids_by_name = {s.name.lower(): s.id for s in batch 
+            if s.name and not s.url_search_string and names[s.name.lower()] == 1}
+        counts = mc_client.sources("*", start_date, today, source_ids=[s.id for s in batch], limit=len(batch))
+        results = {}
+        for row in counts:
+            source_id = ids_by_name.get(row["source"].lower())
+            if source_id is not None:
+                results[source_id] = row["count"]
+
+        #Everything else, including sources with no stories at all, gets counted on its own
+        missing = [s.id for s in batch if s.id not in results]
+        fallback = ordered_map(
+            lambda source_id: mc_client.story_count("*", start_date, today, source_ids=[source_id])["total"],
+            missing,
+            max_workers=workers)
+        results.update(zip(missing, fallback))
+        return results
+
+    volumes = {}
+    for start in range(0, len(sources), batch_size):
+        batch = sources[start:start + batch_size]
+        recent = counts_by_id(batch, month_ago)
+        total = counts_by_id(batch, years_ago)
+        for s in batch:
+            volumes[s.id] = {"recent_volume": recent[s.id], "total_volume": total[s.id], "recent_histogram": []}
+
+    if include_histograms:
+        active = [s.id for s in sources if volumes[s.id]["recent_volume"] > 0]
+        histograms = ordered_map(
+            lambda source_id: mc_client.story_count_over_time("*", month_ago, today, source_ids=[source_id]),
+            active,
+            max_workers=workers)
+        for source_id, histogram in zip(active, histograms):
+            volumes[source_id]["recent_histogram"] = histogram
+
+    return {source_id: SourceVolumePayload(v) for source_id, v in volumes.items()}
+
+
 class Feed():
     """
     Issue detection for a single feed
@@ -54,13 +243,15 @@ class Source():
     """
     
     @classmethod
-    def from_id(cls, source_id:int, skip_volume:bool = False, skip_feeds: bool = True):
-        mc_client = mc_api.DirectoryApi(config.mc_api_token)
+    def from_id(cls, source_id:int, skip_volume:bool = False, skip_feeds: bool = True, membership:MembershipIndex|None = None):
+        mc_client = mc_clients.directory()
         source = mc_client.source(source_id)
-        return Source(source, skip_volume=skip_volume, skip_feeds=skip_feeds)
+        return Source(source, skip_volume=skip_volume, skip_feeds=skip_feeds, membership=membership)
+
 
+    def __init__(self, data: dict, skip_volume: bool = True, skip_feeds: bool = True, membership:MembershipIndex|None = None):
 
-    def __init__(self, data: dict, skip_volume: bool = True, skip_feeds: bool = True):
+        self.membership = membership
 
         self.source_data = SourcePayload(data)
 
@@ -82,17 +273,21 @@ class Source():
 
 
     def get_source_collections(self):
-        mc_client = mc_api.DirectoryApi(config.mc_api_token)
+        if self.membership is not None and self.membership.complete:
+            return self.membership.collections_for(self.source_data.id)
+
+        mc_client = mc_clients.directory()
         return mc_client.collection_list(source_id=self.source_data.id)["results"]
 
 
     #### Source Volume concerns
 
     def get_source_volume(self):
-        mc_client = mc_api.SearchApi(config.mc_api_token)
+        #For many sources at once, get_source_volumes is much cheaper
+        mc_client = mc_clients.search()
         volumes = {}
         today = dt.date.today()
-        month_ago = dt.date.today() - dt.timedelta(days=30)
+        month_ago = dt.date.today() - dt.timedelta(days=RECENT_VOLUME_DAYS)
         
         recent = mc_client.story_count("*", month_ago, today, source_ids=[self.source_data.id])
         volumes["recent_volume"] = recent["total"]
@@ -100,32 +295,33 @@ class Source():
         recent_hist = mc_client.story_count_over_time("*", month_ago, today, source_ids=[self.source_data.id])
         volumes["recent_histogram"] = recent_hist
 
-        years_ago = dt.date.today() - dt.timedelta(days=365 * 10)
+        years_ago = dt.date.today() - dt.timedelta(days=TOTAL_VOLUME_DAYS)
         total_count = mc_client.story_count("*", years_ago, today, source_ids=[self.source_data.id])
         volumes["total_volume"] = total_count["total"]
         return SourceVolumePayload(volumes)
 
 
     def source_volume_issues(self, include_tags=None, exclude_tags=None):
-        return SourceVolumeIssue.calculate_all(self.source_volume, include_tags=include_tags, exclude_tags=exclude_tags)
+        return SourceVolumeIssue.plan(include_tags, exclude_tags).calculate(self.source_volume)
 
     #### Source Feed concerns
 
     def get_source_feeds(self):
-        mc_client = mc_api.DirectoryApi(config.mc_api_token)
+        mc_client = mc_clients.directory()
         feeds = mc_client.feed_list(source_id=self.source_data.id, return_details=True)["results"]
         return [FeedPayload(f) for f in feeds]
 
 
     def source_feed_issues(self, include_tags=None, exclude_tags=None):
         
+        plan = FeedIssue.plan(include_tags, exclude_tags)
         for feed in self.feed_list:
-            feed.issues = FeedIssue.calculate_all(feed, include_tags=include_tags, exclude_tags=exclude_tags)
+            feed.issues = plan.calculate(feed)
         return [feed for feed in self.feed_list if feed.issues is not []]
             
 
     def find_issues(self, include_tags=None, exclude_tags=None):
-        self.source_issues = SourceIssue.calculate_all(self.source_data, include_tags=include_tags, exclude_tags=exclude_tags)
+        self.source_issues = SourceIssue.plan(include_tags, exclude_tags).calculate(self.source_data)
         if self.source_volume is not None:
             self.source_volume_issues = self.source_volume_issues(include_tags=include_tags, exclude_tags=exclude_tags)
         if self.feed_list is not None:
@@ -159,44 +355,99 @@ class Source():
         return source_message
 
 
-    def post_zammad_issue(self, send_email=False):
-        if zammad_client == None:
-            raise RuntimeError("Attempting to post zammad issue without zammad client configuration")
+    def issue_fingerprint(self) -> str:
+        """
+        Hash of the issues found for this source (names and rendered results), which stays the same
+        from run to run as long as the issues do. 
+        """
+        if not self.source_issues:
+            self.find_issues()
 
+        issues = sorted(
+            (issue["issue_name"], issue["template"], bool(issue.get("error", False))) for issue in self.source_issues)
+        return hashlib.sha256(json.dumps(issues).encode("utf-8")).hexdigest()
+
+    def zammad_article(self) -> dict:
+        """
+        The article post_zammad_issue sends, in the form ZammadClient.post_source_articles takes
+        """
         message = self.render_template()
         if(len(self.source_issues) == 0):
             state="closed"
         else:
             state="open"
 
-        collections_str = ", ".join(str(c["id"]) for c in self.collections)
+        return {
+            "source_id": self.source_data.id,
+            "message": message,
+            "title": self.source_data.label,
+            "collections": ", ".join(str(c["id"]) for c in self.collections),
+            "state": state,
+            "fingerprint": self.issue_fingerprint(),
+        }
+
+    def post_zammad_issue(self, send_email=False, force=False):
+        """
+        Post this source's issues to its zammad ticket. Nothing is sent if the issues and ticket state 
+        are the same as the last time they were posted, unless force.
+        """
+        if zammad_client == None:
+            raise RuntimeError("Attempting to post zammad issue without zammad client configuration")
+
+        article = self.zammad_article()
         zammad_client.source_article(
-                message,
-                self.source_data.label,
-                self.source_data.id,
-                collections_str,
+                article["message"],
+                article["title"],
+                article["source_id"],
+                article["collections"],
                 send_email = send_email,
-                state=state
+                state=article["state"],
+                fingerprint=article["fingerprint"],
+                force=force
             )
 
 
 class Collection():
 
     @classmethod
-    def from_id(cls, collection_id:int):
-        mc_client = mc_api.DirectoryApi(config.mc_api_token)
+    def from_id(cls, collection_id:int, **kwargs):
+        mc_client = mc_clients.directory()
         collection = mc_client.collection(collection_id)
-        return Collection(collection)
-
-    def __init__(self, data:dict):
+        return Collection(collection, **kwargs)
+
+    def __init__(self, data:dict, skip_volume:bool = True, skip_feeds:bool = True, max_workers:int|None = None,
+            membership:MembershipIndex|None = None):
+        """
+        Sources are hydrated on a pool of max_workers threads (config.mc_max_workers by default), 
+        pass max_workers=1 to build them one at a time. Either way self.sources keeps the order 
+        returned by source_list. 
+
+        If a complete MembershipIndex (see MembershipIndex.from_collection_ids) is passed, the sources read 
+        their collections from the index instead of making one collection_list call each. Any other index 
+        is ignored, since the collections it is missing would be dropped from the sources' tickets.
+        """
         
         self.collection_data = CollectionPayload(data)
 
-        self.mc_client = mc_api.DirectoryApi(config.mc_api_token)
+        self.mc_client = mc_clients.directory()
         
         sources = self.mc_client.source_list(collection_id=self.collection_data.id, limit=config.mc_api_limit)
 
-        self.sources = [Source(s) for s in sources["results"]]
+        self.membership = membership if membership is not None and membership.complete else None
+
+        if max_workers is None:
+            max_workers = config.mc_max_workers
+
+        #Volumes are fetched for the whole collection at once below, rather than per source
+        self.sources = ordered_map(
+            lambda s: Source(s, skip_volume=True, skip_feeds=skip_feeds, membership=self.membership),
+            sources["results"],
+            max_workers=max_workers)
+
+        if not skip_volume:
+            volumes = get_source_volumes([s.source_data for s in self.sources], max_workers=max_workers)
+            for source in self.sources:
+                source.source_volume = volumes[source.source_data.id]
 
         #Hypothetical search link for embedding in a collection ticket. 
         self.collection_search_string = f"/#search/collections%3A*{self.collection_data.id}"
@@ -205,6 +456,23 @@ class Collection():
         for source in self.sources:
             source.find_issues(include_tags, exclude_tags)
 
+    def post_zammad_issues(self, send_email=False, max_workers:int|None = None, force=False) -> list[dict]:
+        """
+        Post every source's issues to zammad in bulk, see ZammadClient.post_source_articles.
+        Sources whose issues haven't changed since they were last posted are skipped, unless force.
+        Returns the per-source outcomes.
+        """
+        if zammad_client == None:
+            raise RuntimeError("Attempting to post zammad issues without zammad client configuration")
+
+        articles = [source.zammad_article() for source in self.sources]
+        outcomes = zammad_client.post_source_articles(articles, send_email=send_email, max_workers=max_workers,
+            force=force)
+        failed = [o for o in outcomes if o["action"] == "failed"]
+        if failed:
+            logger.warning(f"Failed to post zammad articles for {len(failed)} of {len(outcomes)} sources")
+        return outcomes
+
     def render_source_templates(self):
         templates = []
         for source in self.sources:
@@ -0,0 +1,217 @@
+"""
+Streaming audit of the whole directory (or one collection).
+Sources are paged through source_list and each page is checked and written out before the next
+is fetched, so memory stays flat regardless of directory size.
+
+    python -m directory_issues.audit --output issues.csv --requests-per-second 10
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from . import api_rate_limiter, mc_clients, SourcePayload, SourceIssue, payloads_to_frame
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+AUDIT_COLUMNS = ["source_id", "source_name", "issue_name", "tags", "message", "error"]
+
+
+def iter_source_pages(collection_id:Optional[int] = None, platform:Optional[str] = None,
+        page_size:int = 1000) -> Iterator[List[dict]]:
+    """
+    Yield pages of source dicts from source_list until the directory (or collection) is exhausted.
+    """
+    mc_client = mc_clients.directory()
+    offset = 0
+    while True:
+        response = mc_client.source_list(collection_id=collection_id, platform=platform, limit=page_size, offset=offset)
+        results = response["results"]
+        if results:
+            yield results
+        if response["next"] is None or len(results) == 0:
+            break
+        offset += len(results)
+
+
+class AuditWriter():
+    """
+    Incremental sink for audit rows. Subclasses write and flush each batch as it arrives.
+    """
+
+    @classmethod
+    def for_path(cls, path:str) -> "AuditWriter":
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".csv":
+            return CSVAuditWriter(path)
+        if extension in (".jsonl", ".ndjson"):
+            return JSONLAuditWriter(path)
+        if extension in (".db", ".sqlite", ".sqlite3"):
+            return SQLiteAuditWriter(path)
+        raise ValueError(f"Unsupported audit output format: {path}")
+
+    def __init__(self, path:str):
+        self.path = path
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            Path(db_dir).mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_rows(self, rows:List[Dict[str, Any]]):
+        raise NotImplementedError("Subclasses must implement this method.")
+
+    def close(self):
+        pass
+
+
+class CSVAuditWriter(AuditWriter):
+
+    def __init__(self, path:str):
+        super().__init__(path)
+        self._file = open(path, mode='w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=AUDIT_COLUMNS)
+        self._writer.writeheader()
+
+    def write_rows(self, rows):
+        self._writer.writerows({**row, "tags": ",".join(row["tags"])} for row in rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JSONLAuditWriter(AuditWriter):
+
+    def __init__(self, path:str):
+        super().__init__(path)
+        self._file = open(path, mode='w')
+
+    def write_rows(self, rows):
+        for row in rows:
+            self._file.write(json.dumps(row, default=str) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SQLiteAuditWriter(AuditWriter):
+
+    def __init__(self, path:str, table_name:str = "source_issues"):
+        super().__init__(path)
+        self.table_name = table_name
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+        self._conn.execute(
+            f"CREATE TABLE {table_name} (source_id INTEGER, source_name TEXT, issue_name TEXT, "
+            "tags TEXT, message TEXT, error INTEGER)")
+        self._conn.commit()
+
+    def write_rows(self, rows):
+        self._conn.executemany(
+            f"INSERT INTO {self.table_name} ({', '.join(AUDIT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+            [(r["source_id"], r["source_name"], r["issue_name"], ",".join(r["tags"]), r["message"], int(r["error"]))
+             for r in rows])
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def audit_page(sources:List[dict], include_tags=None, exclude_tags=None) -> List[Dict[str, Any]]:
+    """
+    Run the SourceIssue checks over one page of source dicts, returning one row per issue found.
+    """
+    payloads = [SourcePayload(s) for s in sources]
+    frame = payloads_to_frame(payloads)
+    names = {p.id: p.name for p in payloads}
+    _, results = SourceIssue.calculate_all_frame(frame, include_tags=include_tags, exclude_tags=exclude_tags)
+
+    rows = []
+    for result in results:
+        if result["index"] is None:
+            # The issue failed for the whole page, handled one source at a time below
+            continue
+        source_id = int(result["index"])
+        rows.append({
+            "source_id": source_id,
+            "source_name": names.get(source_id),
+            "issue_name": result["issue_name"],
+            "tags": result["tags"],
+            "message": result["template"],
+            "error": result.get("error", False),
+        })
+
+    failed = [r["issue_name"] for r in results if r["index"] is None]
+    if failed:
+        plan = SourceIssue.plan(include_tags, exclude_tags)
+        for payload in payloads:
+            for result in plan.calculate(payload):
+                if result["issue_name"] in failed:
+                    rows.append({
+                        "source_id": payload.id,
+                        "source_name": payload.name,
+                        "issue_name": result["issue_name"],
+                        "tags": result["tags"],
+                        "message": result["template"],
+                        "error": result.get("error", False),
+                    })
+    return rows
+
+
+def audit_directory(output_path:str, collection_id:Optional[int] = None, platform:Optional[str] = None,
+        page_size:int = 1000, include_tags=None, exclude_tags=None) -> Dict[str, int]:
+    """
+    Page through the directory, writing the issues found on each page to output_path
+    (.csv, .jsonl or .db) as soon as the page has been checked.
+    """
+    sources_checked = 0
+    issues_found = 0
+    with AuditWriter.for_path(output_path) as writer:
+        for page in iter_source_pages(collection_id=collection_id, platform=platform, page_size=page_size):
+            rows = audit_page(page, include_tags=include_tags, exclude_tags=exclude_tags)
+            writer.write_rows(rows)
+            sources_checked += len(page)
+            issues_found += len(rows)
+            logger.info("Checked [%s] sources, found [%s] issues so far", sources_checked, issues_found)
+
+    return {"sources": sources_checked, "issues": issues_found}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream SourceIssue checks over the whole directory.")
+    parser.add_argument('--output', type=str, required=True, help="Output file, .csv, .jsonl or .db")
+    parser.add_argument('--collection-id', type=int, dest="collection_id", default=None,
+        help="Only audit the sources in this collection")
+    parser.add_argument('--platform', type=str, default=None)
+    parser.add_argument('--page-size', type=int, dest="page_size", default=1000)
+    parser.add_argument('--include-tags', type=str, dest="include_tags", default=None,
+        help="Comma-separated issue tags to include")
+    parser.add_argument('--exclude-tags', type=str, dest="exclude_tags", default=None,
+        help="Comma-separated issue tags to exclude")
+    parser.add_argument('--requests-per-second', type=float, dest="requests_per_second", default=None,
+        help="Max requests per second sent to the api, unlimited by default")
+    args = parser.parse_args()
+
+    if args.requests_per_second:
+        #Set before the first request, so every host's limiter is created at this rate
+        api_rate_limiter.per_second = args.requests_per_second
+
+    summary = audit_directory(
+        args.output,
+        collection_id=args.collection_id,
+        platform=args.platform,
+        page_size=args.page_size,
+        include_tags=args.include_tags.split(",") if args.include_tags else None,
+        exclude_tags=args.exclude_tags.split(",") if args.exclude_tags else None)
+    logger.info("Audit complete: %s", summary)
@@ -0,0 +1,336 @@
+"""
+Stand-in for the Media Cloud services the audits and backfill scripts read from, with synthetic data:
+the directory api (sources, collections, feeds), the search api (story counts, count-over-time and the
+per-source breakdown) and the Elasticsearch _search endpoint the mc_providers aggregations go to.
+The data is generated from a seed, so runs at the same scale see the same directory.
+
+Collection k (COLLECTION_ID_BASE + k, k from 0) holds every source whose id is divisible by k + 1,
+so the first collection is the whole directory and each later one is smaller.
+
+    with FakeMediaCloudServer(sources=2000, latency=0.02) as server:
+        clients = MediaCloudClients("fake", base_url=server.url)
+        client = MediaCloudClient(base_url=server.root_url, api_token="fake", directory_url=server.url)
+"""
+import datetime as dt
+import random
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .fake_server import FakeApiHandler, FakeApiServer
+
+API_PATH = "api/"
+COLLECTION_ID_BASE = 1000
+#Page size the directory api falls back on when asked for limit=0
+DEFAULT_PAGE_SIZE = 100
+
+LANGUAGES = ["en", "en", "en", "en", "es", "fr", "de", "pt"]
+
+
+class FakeMediaCloudState():
+    """
+    The synthetic directory and story stats behind a FakeMediaCloudServer. Read-only once built.
+
+    Each source publishes a steady number of stories per day between its first and last story dates;
+    every tenth source stopped publishing 90 days ago, so it has no recent stories. A few sources have
+    the url_search_string and name problems the source issues look for, and a few feeds aren't working.
+    """
+
+    def __init__(self, source_count: int = 1000, collection_count: int = 5, feeds_per_source: int = 2,
+            seed: Optional[int] = 0):
+        rng = random.Random(seed)
+        today = dt.date.today()
+
+        self.sources: Dict[int, Dict[str, Any]] = {}
+        self.stats: Dict[int, Dict[str, Any]] = {}
+        self.feeds: Dict[int, List[Dict[str, Any]]] = {}
+        self.ids_by_name: Dict[str, int] = {}
+
+        for source_id in range(1, source_count + 1):
+            name = f"news{source_id}.example.com"
+            url_search_string = None
+            if source_id % 13 == 0:
+                url_search_string = f"{name}/local"
+            elif source_id % 29 == 0:
+                url_search_string = f"http://{name}/*"
+            elif source_id % 31 == 0:
+                url_search_string = ""
+            if source_id % 50 == 0:
+                name = f"News {source_id}"
+
+            first_date = today - dt.timedelta(days=rng.randint(30, 3650))
+            last_date = today - dt.timedelta(days=90) if source_id % 10 == 7 else today
+            rate = round(rng.lognormvariate(2.5, 1.2), 2)
+            language = rng.choice(LANGUAGES)
+            self.stats[source_id] = {
+                "rate": rate,
+                "first_date": first_date,
+                "last_date": last_date,
+                "language": language,
+                "other_language": "en" if language != "en" else "es",
+            }
+
+            collection_ids = [COLLECTION_ID_BASE + k for k in range(collection_count) if source_id % (k + 1) == 0]
+            self.sources[source_id] = {
+                "id": source_id,
+                "name": name,
+                "url_search_string": url_search_string,
+                "label": f"News {source_id}",
+                "homepage": f"https://{name}/",
+                "notes": None,
+                "platform": "online_news",
+                "stories_per_week": int(rate * 7),
+                "first_story": first_date.isoformat(),
+                "created_at": "2023-01-01T00:00:00Z",
+                "modified_at": "2024-06-01T00:00:00Z",
+                "pub_country": "USA",
+                "pub_state": None,
+                #The backfill scripts are what fill these in
+                "primary_language": None if source_id % 3 == 0 else language,
+                "media_type": "digital_native",
+                "collection_count": len(collection_ids),
+                "collection_ids": collection_ids,
+            }
+            self.ids_by_name[name.lower()] = source_id
+
+            self.feeds[source_id] = [{
+                "id": source_id * 100 + n,
+                "url": f"https://{name}/feed/{n}.xml",
+                "admin_rss_enabled": True,
+                "source": source_id,
+                "name": f"{name} feed {n}",
+                "active": True,
+                "system_status": "Failing" if (source_id + n) % 11 == 0 else "Working",
+                "system_enabled": True,
+                "created_at": "2023-01-01T00:00:00Z",
+            } for n in range(feeds_per_source)]
+
+        self.collections: Dict[int, Dict[str, Any]] = {}
+        for k in range(collection_count):
+            collection_id = COLLECTION_ID_BASE + k
+            self.collections[collection_id] = {
+                "id": collection_id,
+                "name": f"Synthetic collection {k}",
+                "notes": None,
+                "platform": "online_news",
+                "source_count": source_count // (k + 1),
+                "public": True,
+                "featured": False,
+                "managed": False,
+            }
+
+    @staticmethod
+    def page(results: List[Any], limit: int, offset: int, path: str) -> Dict[str, Any]:
+        limit = limit or DEFAULT_PAGE_SIZE
+        page = results[offset:offset + limit]
+        has_next = offset + len(page) < len(results)
+        return {
+            "count": len(results),
+            "next": f"{path}?limit={limit}&offset={offset + limit}" if has_next else None,
+            "previous": None,
+            "results": page,
+        }
+
+    def source(self, source_id: int) -> Optional[Dict[str, Any]]:
+        source = self.sources.get(source_id)
+        return None if source is None else {k: v for k, v in source.items() if k != "collection_ids"}
+
+    def source_list(self, collection_id: Optional[int] = None, platform: Optional[str] = None,
+            name: Optional[str] = None) -> List[Dict[str, Any]]:
+        results = []
+        for source_id, source in self.sources.items():
+            if collection_id is not None and collection_id not in source["collection_ids"]:
+                continue
+            if platform and source["platform"] != platform:
+                continue
+            if name and name.lower() not in source["name"].lower():
+                continue
+            results.append(self.source(source_id))
+        return results
+
+    def collection_list(self, source_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        if source_id is None:
+            return list(self.collections.values())
+        source = self.sources.get(source_id)
+        return [] if source is None else [self.collections[c] for c in source["collection_ids"]]
+
+    def source_ids_for(self, source_ids: str = "", collection_ids: str = "") -> List[int]:
+        ids = [int(s) for s in source_ids.split(",") if s]
+        for collection_id in (int(c) for c in collection_ids.split(",") if c):
+            ids += [s for s, source in self.sources.items() if collection_id in source["collection_ids"]]
+        return [s for s in dict.fromkeys(ids) if s in self.stats]
+
+    def active_days(self, source_id: int, start: dt.date, end: dt.date) -> Tuple[Optional[dt.date], int]:
+        stats = self.stats[source_id]
+        first = max(start, stats["first_date"])
+        last = min(end, stats["last_date"])
+        if last < first:
+            return None, 0
+        return first, (last - first).days + 1
+
+    def story_count(self, source_id: int, start: dt.date, end: dt.date) -> int:
+        return int(self.stats[source_id]["rate"] * self.active_days(source_id, start, end)[1])
+
+    def count_over_time(self, source_ids: List[int], start: dt.date, end: dt.date) -> List[Dict[str, Any]]:
+        counts = []
+        day = start
+        while day <= end:
+            count = sum(self.story_count(s, day, day) for s in source_ids)
+            counts.append({"date": day.isoformat(), "count": count, "total_count": count, "ratio": 1.0 if count else 0.0})
+            day += dt.timedelta(days=1)
+        return counts
+
+    def language_buckets(self, source_id: int, count: int, size: int) -> List[Dict[str, Any]]:
+        stats = self.stats[source_id]
+        other = count // 10
+        buckets = [{"key": stats["language"], "doc_count": count - other}, {"key": stats["other_language"], "doc_count": other}]
+        return [b for b in buckets if b["doc_count"] > 0][:size]
+
+    def first_publication(self, source_id: int, start: dt.date, end: dt.date) -> Dict[str, Any]:
+        first, days = self.active_days(source_id, start, end)
+        if not days or not self.story_count(source_id, start, end):
+            return {"value": None}
+        moment = dt.datetime(first.year, first.month, first.day, tzinfo=dt.timezone.utc)
+        return {"value": moment.timestamp() * 1000, "value_as_string": moment.strftime("%Y-%m-%dT%H:%M:%S.000Z")}
+
+
+class _Handler(FakeApiHandler):
+    server: "FakeMediaCloudServer"
+
+    def is_read(self, method: str, path: str) -> bool:
+        return method == "GET" or path.endswith("_search")
+
+    def route(self, method: str, path: str, query: Dict[str, str]):
+        if path.startswith(API_PATH):
+            return self.route_api(method, path[len(API_PATH):].strip("/"), query)
+        if method == "POST" and path.endswith("_search"):
+            return self.elasticsearch(self._body())
+        return self._send(404, {"error": "Not found"})
+
+    def route_api(self, method: str, path: str, query: Dict[str, str]):
+        state = self.server.state
+        limit = int(query.get("limit") or 0)
+        offset = int(query.get("offset") or 0)
+
+        def optional_int(key):
+            return int(query[key]) if query.get(key) else None
+
+        if path == "sources/sources":
+            results = state.source_list(optional_int("collection_id"), query.get("platform"), query.get("name"))
+            return self._send(200, state.page(results, limit, offset, path))
+
+        if path == "sources/collections":
+            return self._send(200, state.page(state.collection_list(optional_int("source_id")), limit, offset, path))
+
+        if path in ("sources/feeds", "sources/feeds/details"):
+            source_id = optional_int("source_id")
+            if source_id is None:
+                feeds = [f for source_feeds in state.feeds.values() for f in source_feeds]
+            else:
+                feeds = state.feeds.get(source_id, [])
+            if path.endswith("details"):
+                return self._send(200, {"feeds": feeds})
+            return self._send(200, state.page(feeds, limit, offset, path))
+
+        match = re.fullmatch(r"sources/(sources|collections)/([0-9]+)", path)
+        if match:
+            item_id = int(match.group(2))
+            item = state.source(item_id) if match.group(1) == "sources" else state.collections.get(item_id)
+            if item is None:
+                return self._send(404, {"detail": "Not found."})
+            return self._send(200, item)
+
+        if path.startswith("search/"):
+            return self.search(path[len("search/"):], query)
+
+        return self._send(404, {"detail": "Not found."})
+
+    def search(self, endpoint: str, query: Dict[str, str]):
+        state = self.server.state
+        start = dt.date.fromisoformat(query["start"][:10])
+        end = dt.date.fromisoformat(query["end"][:10])
+        source_ids = state.source_ids_for(query.get("ss", ""), query.get("cs", ""))
+
+        if endpoint == "total-count":
+            total = sum(state.story_count(s, start, end) for s in source_ids)
+            return self._send(200, {"count": {"relevant": total, "total": total}})
+
+        if endpoint == "count-over-time":
+            return self._send(200, {"count_over_time": {"counts": state.count_over_time(source_ids, start, end)}})
+
+        if endpoint == "sources":
+            counts = [(state.sources[s]["name"], state.story_count(s, start, end)) for s in source_ids]
+            counts = sorted((c for c in counts if c[1] > 0), key=lambda c: -c[1])
+            limit = int(query.get("limit") or len(counts))
+            return self._send(200, {"sources": [{"source": name, "count": count} for name, count in counts[:limit]]})
+
+        return self._send(404, {"detail": "Not found."})
+
+    def elasticsearch(self, body: Dict[str, Any]):
+        #Only the aggregation-only searches MediaCloudClient makes: a publication_date range, domains given as a
+        #query_string of canonical_domain:X or a terms filter, and a languages / first_publication / domains aggregation
+        state = self.server.state
+        start, end = dt.date.min, dt.date.max
+        domains: List[str] = []
+        boolean = body.get("query", {}).get("bool", {})
+        for clause in boolean.get("filter", []) + boolean.get("must", []):
+            if "range" in clause:
+                dates = clause["range"]["publication_date"]
+                start = dt.date.fromisoformat(dates["gte"])
+                end = dt.date.fromisoformat(dates["lte"])
+            elif "terms" in clause:
+                domains += clause["terms"].get("canonical_domain", [])
+            elif "query_string" in clause:
+                domains += re.findall(r"canonical_domain:(\S+)", clause["query_string"]["query"])
+
+        source_ids = [state.ids_by_name[d.lower()] for d in domains if d.lower() in state.ids_by_name]
+        counts = {s: state.story_count(s, start, end) for s in source_ids}
+
+        def aggregate(aggs: Dict[str, Any], ids: List[int]) -> Dict[str, Any]:
+            results = {}
+            for name, agg in aggs.items():
+                if name == "domains":
+                    buckets = [{
+                        "key": state.sources[s]["name"],
+                        "doc_count": counts[s],
+                        **aggregate(agg.get("aggs", {}), [s]),
+                    } for s in ids if counts[s] > 0]
+                    results[name] = {"buckets": buckets[:agg["terms"].get("size", 10)]}
+                elif "terms" in agg:
+                    size = agg["terms"].get("size", 10)
+                    buckets = {}
+                    for s in ids:
+                        for bucket in state.language_buckets(s, counts[s], size):
+                            buckets[bucket["key"]] = buckets.get(bucket["key"], 0) + bucket["doc_count"]
+                    ordered = sorted(buckets.items(), key=lambda b: -b[1])[:size]
+                    results[name] = {"buckets": [{"key": key, "doc_count": count} for key, count in ordered]}
+                elif "min" in agg:
+                    firsts = [state.first_publication(s, start, end) for s in ids]
+                    firsts = [f for f in firsts if f["value"] is not None]
+                    results[name] = min(firsts, key=lambda f: f["value"]) if firsts else {"value": None}
+            return results
+
+        response = {
+            "took": 1,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": sum(counts.values()), "relation": "eq"}, "max_score": None, "hits": []},
+            "aggregations": aggregate(body.get("aggs", {}), source_ids),
+        }
+        #The elasticsearch client refuses to talk to anything which doesn't say it's elasticsearch
+        return self._send(200, response, headers={"X-Elastic-Product": "Elasticsearch"})
+
+
+class FakeMediaCloudServer(FakeApiServer):
+    """
+    Serves a FakeMediaCloudState: the directory and search api under url, Elasticsearch at root_url.
+    See FakeMediaCloudState for the data and FakeApiServer for the latency and failure options.
+    """
+    handler_class = _Handler
+
+    def __init__(self, sources: int = 1000, collections: int = 5, feeds_per_source: int = 2, **options):
+        super().__init__(**options)
+        self.state = FakeMediaCloudState(sources, collections, feeds_per_source, seed=options.get("seed", 0))
+
+    @property
+    def url(self) -> str:
+        return f"{self.root_url}/{API_PATH}"
@@ -0,0 +1,216 @@
+"""
+Plumbing shared by the benchmark fakes: a threaded localhost http server with injectable latency and failures,
+and a json request handler which counts every request by endpoint before dispatching it.
+The counts are also served at /_fake/requests, for servers run in another process with ServerProcess.
+"""
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Type
+from urllib.parse import parse_qs, urlparse
+
+STATS_PATH = "/_fake/requests"
+
+
+class RequestCounter():
+    """
+    Requests per endpoint, safe to update from the handler threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.requests[endpoint] += 1
+
+    def snapshot(self) -> Counter:
+        with self.lock:
+            return Counter(self.requests)
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    """
+    Subclasses set API_PREFIX and implement route(method, path, query). Paths outside API_PREFIX are a 404.
+    """
+    API_PREFIX = "/"
+    server: "FakeApiServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    @staticmethod
+    def endpoint_name(method: str, path: str) -> str:
+        #Ids are folded out of the path, so requests for different tickets or sources are counted together
+        return f"{method} {re.sub(r'/[0-9]+(?=/|$)', '/:id', path)}"
+
+    def _handle(self, method: str):
+        url = urlparse(self.path)
+        if url.path == STATS_PATH:
+            return self._send(200, self.server.requests)
+        if not url.path.startswith(self.API_PREFIX):
+            return self._send(404, {"error": "Not found"})
+        path = url.path[len(self.API_PREFIX):].strip("/")
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        self.server.counter.count(self.endpoint_name(method, path))
+
+        failure = self.server.injected_failure(self.is_read(method, path))
+        if failure is not None:
+            return self._send(failure, {"error": "Injected failure"})
+        self.server.wait()
+        return self.route(method, path, query)
+
+    def is_read(self, method: str, path: str) -> bool:
+        return method == "GET"
+
+    def route(self, method: str, path: str, query: Dict[str, str]):
+        raise NotImplementedError("Subclasses must implement this method.")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    """
+    Serves a FakeApiHandler on localhost from a background thread.
+
+    latency (seconds, plus up to jitter more) is added to every request. error_rate is the fraction
+    of writes answered with error_status instead, or of all requests with fail_reads.
+    """
+    daemon_threads = True
+    handler_class = FakeApiHandler
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+            error_status: int = 503, fail_reads: bool = False, port: int = 0, seed: Optional[int] = None):
+        super().__init__(("127.0.0.1", port), self.handler_class)
+        self.counter = RequestCounter()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fail_reads = fail_reads
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def root_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return self.root_url + self.handler_class.API_PREFIX
+
+    @property
+    def requests(self) -> Counter:
+        return self.counter.snapshot()
+
+    def wait(self):
+        delay = self.latency
+        if self.jitter:
+            with self._random_lock:
+                delay += self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def injected_failure(self, read: bool) -> Optional[int]:
+        if not self.error_rate or (read and not self.fail_reads):
+            return None
+        with self._random_lock:
+            failed = self._random.random() < self.error_rate
+        return self.error_status if failed else None
+
+    def start(self) -> "FakeApiServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _serve(server_cls: Type[FakeApiServer], options: Dict[str, Any], urls) -> None:
+    server = server_cls(**options)
+    urls.put({"root_url": server.root_url, "url": server.url})
+    server.serve_forever()
+
+
+class ServerProcess():
+    """
+    Runs a FakeApiServer in a child process, so the time and memory it spends building responses
+    don't show up in measurements of the client under test. Request counts are fetched over http.
+
+        with ServerProcess(FakeMediaCloudServer, sources=1000) as server:
+            clients = MediaCloudClients("fake", base_url=server.url)
+    """
+
+    def __init__(self, server_cls: Type[FakeApiServer], **options):
+        self.server_cls = server_cls
+        self.options = options
+        self.root_url: Optional[str] = None
+        self.url: Optional[str] = None
+        self._process: Optional[multiprocessing.Process] = None
+
+    @property
+    def requests(self) -> Counter:
+        with urllib.request.urlopen(self.root_url + STATS_PATH) as response:
+            return Counter(json.loads(response.read()))
+
+    def start(self, timeout: float = 30) -> "ServerProcess":
+        urls = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_serve, args=(self.server_cls, self.options, urls), daemon=True)
+        self._process.start()
+        started = urls.get(timeout=timeout)
+        self.root_url = started["root_url"]
+        self.url = started["url"]
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,132 @@
+"""
+In-process stand-in for the parts of the Zammad REST api ZammadClient uses: ticket search, create,
+update and find, and tag add. Tickets live in memory. Latency and failures can be injected, and
+every request is counted, so posting can be exercised and timed without touching support.mediacloud.org.
+
+    with FakeZammadServer(latency=0.02) as server:
+        client = ZammadClient(url=server.url, token="fake")
+"""
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from .fake_server import FakeApiHandler, FakeApiServer
+
+
+class FakeZammadState():
+    """
+    The tickets behind a FakeZammadServer, safe to use from its handler threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tickets: Dict[int, Dict[str, Any]] = {}
+        self.articles: Dict[int, List[Dict[str, Any]]] = {}
+        self.next_id = 1
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        match = re.match(r"\s*source:\s*\(?([^)]*)\)?\s*$", query)
+        if not match:
+            return []
+        sources = {s for s in re.split(r"\s+OR\s+|\s+", match.group(1).strip()) if s}
+        with self.lock:
+            return [dict(t) for t in self.tickets.values() if str(t.get("source")) in sources]
+
+    def create(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self.lock:
+            ticket_id = self.next_id
+            self.next_id += 1
+            tags = params.get("tags") or ""
+            ticket = {
+                "id": ticket_id,
+                "title": params.get("title"),
+                "group": params.get("group"),
+                "customer": params.get("customer"),
+                "source": params.get("source"),
+                "collections": params.get("collections"),
+                "state": params.get("state", "new"),
+                "tags": [t for t in tags.split(",") if t] if isinstance(tags, str) else list(tags),
+            }
+            self.tickets[ticket_id] = ticket
+            self.articles[ticket_id] = [params["article"]] if params.get("article") else []
+            return dict(ticket)
+
+    def update(self, ticket_id: int, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            ticket = self.tickets.get(ticket_id)
+            if ticket is None:
+                return None
+            for key in ("title", "collections", "state"):
+                if key in params:
+                    ticket[key] = params[key]
+            if params.get("article"):
+                self.articles[ticket_id].append(params["article"])
+            return dict(ticket)
+
+    def find(self, ticket_id: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            ticket = self.tickets.get(ticket_id)
+            return None if ticket is None else dict(ticket)
+
+    def add_tag(self, ticket_id: int, tag: str) -> bool:
+        with self.lock:
+            ticket = self.tickets.get(ticket_id)
+            if ticket is None:
+                return False
+            if tag not in ticket["tags"]:
+                ticket["tags"].append(tag)
+            return True
+
+    def delete(self, ticket_id: int):
+        #For simulating tickets removed behind a client's back
+        with self.lock:
+            self.tickets.pop(ticket_id, None)
+            self.articles.pop(ticket_id, None)
+
+
+class _Handler(FakeApiHandler):
+    API_PREFIX = "/api/v1/"
+    server: "FakeZammadServer"
+
+    def route(self, method: str, path: str, query: Dict[str, str]):
+        state = self.server.state
+
+        if method == "GET" and path == "tickets/search":
+            tickets = state.search(query.get("query", ""))
+            page = int(query.get("page", 1))
+            per_page = int(query.get("per_page", 10))
+            return self._send(200, tickets[(page - 1) * per_page:page * per_page])
+
+        if method == "POST" and path == "tickets":
+            return self._send(201, state.create(self._body()))
+
+        if method == "POST" and path == "tags/add":
+            if state.add_tag(int(query.get("o_id", 0)), query.get("item", "")):
+                return self._send(201, True)
+            return self._send(404, {"error": "Couldn't find Ticket"})
+
+        match = re.fullmatch(r"tickets/([0-9]+)", path)
+        if match:
+            ticket_id = int(match.group(1))
+            if method == "PUT":
+                ticket = state.update(ticket_id, self._body())
+            elif method == "GET":
+                ticket = state.find(ticket_id)
+            else:
+                ticket = None
+            if ticket is None:
+                return self._send(404, {"error": f"Couldn't find Ticket with 'id'={ticket_id}"})
+            return self._send(200, ticket)
+
+        return self._send(404, {"error": "Not found"})
+
+
+class FakeZammadServer(FakeApiServer):
+    """
+    Serves a FakeZammadState on localhost from a background thread, see FakeApiServer for the options.
+    """
+    handler_class = _Handler
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.state = FakeZammadState()
@@ -0,0 +1,151 @@
+"""
+Wall time, api requests and peak python memory of the directory audits and source backfills,
+run against a FakeMediaCloudServer in a child process so its own work stays out of the numbers.
+
+    audit               Collection.from_id(...).find_all_issues(), source metadata only
+    audit-full          the same with volumes and feeds
+    audit-sequential    audit-full with the sources hydrated one at a time
+    language            SourceLanguage.process_sources, one query per group of domains
+    language-per-source SourceLanguage.process_sources, one query per source
+    publication-date    SourcesPublicationDate.process_sources, one query per group of domains
+    publication-date-per-source
+
+Peak memory comes from tracemalloc, which slows python down; pass --no-memory for cleaner timings.
+
+    python -m directory_issues.benchmarks.mediacloud_audits --sources 2000 --latency 0.02 --workers 8
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+import directory_issues
+from ..clients.mediacloud_client import MediaCloudClients
+from ..scripts.client import MediaCloudClient
+from ..scripts.sources import base as sources_base
+from ..scripts.sources.update_language import SourceLanguage
+from ..scripts.sources.update_publication_date import SourcesPublicationDate
+from .fake_mediacloud import COLLECTION_ID_BASE, FakeMediaCloudServer
+from .fake_server import ServerProcess
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+FAKE_TOKEN = "fake"
+
+
+def audit(server: ServerProcess, options: argparse.Namespace, **collection_options) -> None:
+    #Source and Collection go through the module's shared clients, so swap in ones pointed at the fake
+    clients = MediaCloudClients(FAKE_TOKEN, pool_size=max(options.workers, 1) * 2, base_url=server.url)
+    shared_clients = directory_issues.mc_clients
+    directory_issues.mc_clients = clients
+    try:
+        collection = directory_issues.Collection.from_id(options.collection, max_workers=options.workers,
+            **collection_options)
+        collection.find_all_issues()
+    finally:
+        directory_issues.mc_clients = shared_clients
+        clients.close()
+
+
+def backfill(analyzer_cls, per_source: bool = False):
+    def run(server: ServerProcess, options: argparse.Namespace) -> None:
+        client = MediaCloudClient(base_url=server.root_url, api_token=FAKE_TOKEN, directory_url=server.url)
+        analyzer = analyzer_cls(client, max_workers=options.workers)
+        if per_source:
+            #Hide analyze_sources, so SourcesBase falls back on one analyze_source query per domain
+            analyzer.supports_batch_analysis = lambda: False
+        with tempfile.TemporaryDirectory() as output_dir:
+            analyzer.process_sources(platform="online_news", batch_size=options.batch_size,
+                file_name=os.path.join(output_dir, "backfill"), resume=False)
+    return run
+
+
+SCENARIOS: Dict[str, Callable[[ServerProcess, argparse.Namespace], None]] = {
+    "audit": audit,
+    "audit-full": lambda server, options: audit(server, options, skip_volume=False, skip_feeds=False),
+    "audit-sequential": lambda server, options: audit(server, argparse.Namespace(**{**vars(options), "workers": 1}),
+        skip_volume=False, skip_feeds=False),
+    "language": backfill(SourceLanguage),
+    "language-per-source": backfill(SourceLanguage, per_source=True),
+    "publication-date": backfill(SourcesPublicationDate),
+    "publication-date-per-source": backfill(SourcesPublicationDate, per_source=True),
+}
+
+
+def run_scenario(name: str, server: ServerProcess, options: argparse.Namespace) -> Dict:
+    requests_before = server.requests
+    if options.memory:
+        tracemalloc.start()
+    error = None
+    start = time.perf_counter()
+    try:
+        SCENARIOS[name](server, options)
+    except Exception as e:
+        #Nothing in the audits retries, so with --error-rate a run can fail part way through
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if options.memory else None
+        if options.memory:
+            tracemalloc.stop()
+    requests = server.requests - requests_before
+    return {
+        "scenario": name,
+        "seconds": elapsed,
+        "requests": sum(requests.values()),
+        "peak_mib": None if peak is None else peak / 2 ** 20,
+        "by_endpoint": dict(requests),
+        "error": error,
+    }
+
+
+def main(options: argparse.Namespace):
+    if not options.verbose:
+        #The backfills log every batch
+        sources_base.logger.setLevel(logging.WARNING)
+
+    server_options = {
+        "sources": options.sources,
+        "collections": options.collections,
+        "feeds_per_source": options.feeds_per_source,
+        "latency": options.latency,
+        "jitter": options.jitter,
+        "error_rate": options.error_rate,
+        "fail_reads": options.error_rate > 0,
+        "seed": options.seed,
+    }
+    print(f"{'scenario':<30}{'seconds':>9}{'requests':>10}{'peak MiB':>10}")
+    with ServerProcess(FakeMediaCloudServer, **server_options) as server:
+        for name in options.scenarios.split(","):
+            row = run_scenario(name, server, options)
+            peak = "-" if row["peak_mib"] is None else f"{row['peak_mib']:.1f}"
+            print(f"{row['scenario']:<30}{row['seconds']:>9.2f}{row['requests']:>10}{peak:>10}")
+            if row["error"]:
+                print(f"{'':<4}failed: {row['error']}")
+            if options.verbose:
+                for endpoint, count in sorted(row["by_endpoint"].items()):
+                    print(f"{'':<4}{endpoint:<36}{count:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the directory audits and backfills against an offline fake Media Cloud.")
+    parser.add_argument('--sources', type=int, default=500, help="Sources in the synthetic directory")
+    parser.add_argument('--collections', type=int, default=5, help="Synthetic collections, each smaller than the last")
+    parser.add_argument('--feeds-per-source', type=int, dest="feeds_per_source", default=2)
+    parser.add_argument('--collection', type=int, default=COLLECTION_ID_BASE,
+        help="Collection to audit, the first one holds every source")
+    parser.add_argument('--scenarios', type=str, default=",".join(SCENARIOS), help="Comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument('--workers', type=int, default=8, help="Worker threads for the audits and backfills")
+    parser.add_argument('--batch-size', type=int, dest="batch_size", default=100, help="Sources per backfill batch")
+    parser.add_argument('--latency', type=float, default=0.01, help="Seconds added to every request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many more seconds per request")
+    parser.add_argument('--error-rate', type=float, dest="error_rate", default=0.0,
+        help="Fraction of requests answered with a 503")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_false', dest="memory", help="Don't trace peak memory")
+    parser.add_argument('--verbose', action='store_true', help="Show request counts per endpoint, and the backfills' logs")
+    main(parser.parse_args())
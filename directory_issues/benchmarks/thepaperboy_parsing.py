@@ -0,0 +1,97 @@
+"""
+Per-page parse time of the thepaperboy page parsers, over the saved pages in fixtures/thepaperboy.
+Both parsers must produce the same records for every fixture before any timings are reported.
+
+    python -m directory_issues.benchmarks.thepaperboy_parsing --repeat 20
+"""
+import argparse
+import copy
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "thepaperboy")
+SCRAPERS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "scrapers")
+
+# The scrapers are run as scripts from their own directory, so their modules import each other that way
+if SCRAPERS_DIR not in sys.path:
+    sys.path.insert(0, SCRAPERS_DIR)
+
+from thepaperboy_pages import PAGE_PARSERS  # noqa: E402
+
+# fixture file -> (parser method, extra argument)
+FIXTURES = {
+    "countries.html": ("parse_locations", "countries"),
+    "states.html": ("parse_locations", "states"),
+    "country_sources.html": ("parse_location_sources", {"name": "Exampleland", "level": "country"}),
+    "state_sources.html": ("parse_location_sources", {"name": "Alabama", "country": "United States", "level": "state"}),
+    "source.html": ("parse_source_metadata", {"name": "Springfield Daily Herald", "url": "/springfield-daily-herald.cfm"}),
+}
+
+
+def parse_fixture(parser, text: str, method: str, argument):
+    # parse_source_metadata fills in the dict it is given, so each run gets a fresh copy
+    return getattr(parser, method)(text, copy.deepcopy(argument))
+
+
+def check_parsers_agree(pages: dict) -> None:
+    reference = PAGE_PARSERS["bs4"]()
+    for name, parser_cls in PAGE_PARSERS.items():
+        parser = parser_cls()
+        for fixture, text in pages.items():
+            method, argument = FIXTURES[fixture]
+            expected = parse_fixture(reference, text, method, argument)
+            actual = parse_fixture(parser, text, method, argument)
+            if actual != expected:
+                raise AssertionError(f"{name} parser disagrees with bs4 on {fixture}")
+            if not actual:
+                raise AssertionError(f"No records parsed from {fixture}")
+
+
+def time_parsers(pages: dict, repeat: int) -> list:
+    rows = []
+    for fixture, text in pages.items():
+        method, argument = FIXTURES[fixture]
+        timings = {}
+        for name, parser_cls in PAGE_PARSERS.items():
+            parser = parser_cls()
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                parse_fixture(parser, text, method, argument)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+        rows.append((fixture, len(text), timings))
+    return rows
+
+
+def load_fixtures() -> dict:
+    pages = {}
+    for fixture in FIXTURES:
+        with open(os.path.join(FIXTURES_DIR, fixture), encoding="utf-8") as f:
+            pages[fixture] = f.read()
+    return pages
+
+
+def main(repeat: int = 10):
+    pages = load_fixtures()
+    check_parsers_agree(pages)
+
+    names = list(PAGE_PARSERS)
+    print(f"{'fixture':<22}{'bytes':>9}" + "".join(f"{name + ' ms':>12}" for name in names) + f"{'speedup':>10}")
+    for fixture, size, timings in time_parsers(pages, repeat):
+        speedup = timings["bs4"] / timings["lxml"]
+        print(f"{fixture:<22}{size:>9}" + "".join(f"{timings[name] * 1000:>12.2f}" for name in names)
+              + f"{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the thepaperboy page parsers on saved pages.")
+    parser.add_argument('--repeat', type=int, default=10, help="Runs per parser and page, the best is reported")
+    args = parser.parse_args()
+    main(args.repeat)
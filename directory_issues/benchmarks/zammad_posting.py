@@ -0,0 +1,133 @@
+"""
+Tickets-posted-per-second for a synthetic collection, against a FakeZammadServer.
+
+Each mode gets a fresh server and ticket cache and posts the collection three times: the first pass creates
+every ticket, the next repeats the same issues, and the last changes the issues of every source.
+The repeat is skipped by the issue fingerprints unless --no-fingerprints.
+
+    python -m directory_issues.benchmarks.zammad_posting --sources 500 --latency 0.05 --workers 8
+"""
+import argparse
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, Dict, List
+
+from ..cache import SourceTicketCache
+from ..clients.zammad_client import ZammadClient
+from .fake_zammad import FakeZammadServer
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+ISSUES = ["Bad name", "HTTP prefix", "No recent stories", "Empty url_search_string", "No active feeds"]
+
+
+def synthetic_articles(source_count: int, run: int = 0, fingerprints: bool = True) -> List[Dict]:
+    """
+    One article per source, in the form Source.zammad_article returns. run changes every source's issues.
+    """
+    articles = []
+    for source_id in range(1, source_count + 1):
+        issues = [ISSUES[(source_id + i) % len(ISSUES)] for i in range(source_id % 3)]
+        items = "".join(f"<li> {issue} (run {run}) </li>" for issue in issues) or "<li> No issues detected </li>"
+        article = {
+            "source_id": source_id,
+            "title": f"source-{source_id}.example.com",
+            "message": f"<body><h1>source-{source_id}.example.com : Issues</h1><ul>{items}</ul></body>",
+            "collections": f"{1000 + source_id % 7}",
+            "state": "open" if issues else "closed",
+        }
+        if fingerprints:
+            article["fingerprint"] = hashlib.sha256(f"{issues}:{run}".encode("utf-8")).hexdigest()
+        articles.append(article)
+    return articles
+
+
+def post_sequentially(client: ZammadClient, articles: List[Dict], workers: int) -> List[Dict]:
+    #What Source.post_zammad_issue does for each source in turn
+    outcomes = []
+    for article in articles:
+        try:
+            response = client.source_article(article["message"], article["title"], article["source_id"],
+                article["collections"], state=article["state"], fingerprint=article.get("fingerprint"))
+            outcomes.append({"action": "skipped" if response is None else "posted"})
+        except Exception as e:
+            outcomes.append({"action": "failed", "error": str(e)})
+    return outcomes
+
+
+def post_in_bulk(client: ZammadClient, articles: List[Dict], workers: int) -> List[Dict]:
+    return client.post_source_articles(articles, max_workers=workers)
+
+
+MODES: Dict[str, Callable[[ZammadClient, List[Dict], int], List[Dict]]] = {
+    "sequential": post_sequentially,
+    "bulk": post_in_bulk,
+}
+
+
+def run_mode(mode: str, source_count: int, workers: int, fingerprints: bool, server_options: Dict) -> List[Dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir, FakeZammadServer(**server_options) as server:
+        cache = SourceTicketCache(os.path.join(cache_dir, "tickets.db"))
+        client = ZammadClient(ticket_cache=cache, url=server.url, token="fake")
+        for run, label in ((0, "create"), (0, "repeat"), (1, "changed")):
+            articles = synthetic_articles(source_count, run=run, fingerprints=fingerprints)
+            requests_before = server.requests
+            start = time.perf_counter()
+            outcomes = MODES[mode](client, articles, workers)
+            elapsed = time.perf_counter() - start
+
+            actions = Counter(o["action"] for o in outcomes)
+            posted = sum(n for action, n in actions.items() if action not in ("skipped", "failed"))
+            requests = server.requests - requests_before
+            results.append({
+                "mode": mode,
+                "pass": label,
+                "seconds": elapsed,
+                "posted": posted,
+                "skipped": actions.get("skipped", 0),
+                "failed": actions.get("failed", 0),
+                "per_second": posted / elapsed if elapsed else 0.0,
+                "requests": sum(requests.values()),
+                "by_endpoint": dict(requests),
+            })
+        cache.close()
+        client.client.session.close()
+    return results
+
+
+def main(source_count: int, workers: int, modes: List[str], fingerprints: bool, verbose: bool, **server_options):
+    print(f"{'mode':<12}{'pass':<9}{'seconds':>9}{'posted':>8}{'skipped':>9}{'failed':>8}{'tickets/s':>11}{'requests':>10}")
+    for mode in modes:
+        for row in run_mode(mode, source_count, workers, fingerprints, server_options):
+            print(f"{row['mode']:<12}{row['pass']:<9}{row['seconds']:>9.2f}{row['posted']:>8}{row['skipped']:>9}"
+                  f"{row['failed']:>8}{row['per_second']:>11.1f}{row['requests']:>10}")
+            if verbose:
+                for endpoint, count in sorted(row["by_endpoint"].items()):
+                    print(f"{'':<21}{endpoint:<30}{count:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark posting source issues to an offline fake zammad.")
+    parser.add_argument('--sources', type=int, default=300, help="Sources in the synthetic collection")
+    parser.add_argument('--workers', type=int, default=8, help="Worker threads for bulk posting")
+    parser.add_argument('--modes', type=str, default=",".join(MODES), help="Comma-separated: " + ", ".join(MODES))
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many more seconds per request")
+    parser.add_argument('--error-rate', type=float, dest="error_rate", default=0.0,
+        help="Fraction of writes answered with --error-status")
+    parser.add_argument('--error-status', type=int, dest="error_status", default=503)
+    parser.add_argument('--no-fingerprints', action='store_false', dest="fingerprints",
+        help="Post articles without issue fingerprints, so nothing is skipped")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help="Show request counts per endpoint")
+    args = parser.parse_args()
+
+    main(args.sources, args.workers, args.modes.split(","), args.fingerprints, args.verbose,
+         latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+         error_status=args.error_status, seed=args.seed)
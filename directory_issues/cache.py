@@ -0,0 +1,265 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache():
+    """
+    Interface for caching api responses, keyed on endpoint + params.
+    Subclasses implement _get and _set; counting hits and misses and honoring bypass happens here.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, default_ttl: float = 3600, bypass: bool = False):
+        #ttls maps an endpoint prefix to a lifetime in seconds, the longest matching prefix wins
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        #get is called from worker threads
+        self._stats_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.hits} hits, {self.misses} misses)"
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Dict] = None) -> str:
+        return endpoint + "?" + json.dumps(params or {}, sort_keys=True, default=str)
+
+    def ttl_for(self, endpoint: str) -> float:
+        matches = [prefix for prefix in self.ttls if endpoint.startswith(prefix)]
+        if not matches:
+            return self.default_ttl
+        return self.ttls[max(matches, key=len)]
+
+    def get(self, endpoint: str, params: Optional[Dict] = None) -> Optional[Any]:
+        if self.bypass:
+            return None
+        value = self._get(self.make_key(endpoint, params))
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, endpoint: str, params: Optional[Dict], value: Any):
+        if self.bypass:
+            return
+        ttl = self.ttl_for(endpoint)
+        if ttl <= 0:
+            return
+        self._set(self.make_key(endpoint, params), value, time.time() + ttl)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        raise NotImplementedError("Subclasses must implement this method.")
+
+    def _get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError("Subclasses must implement this method.")
+
+    def _set(self, key: str, value: Any, expires_at: float):
+        raise NotImplementedError("Subclasses must implement this method.")
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    ResponseCache persisted in a local SQLite file. Holds at most max_entries responses,
+    evicting the least recently used ones first. Rows are counted as they are written, and once
+    there are more than max_entries the oldest evict_fraction of them go in one delete, so most
+    writes don't have to look at the rest of the table.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, evict_fraction: float = 0.1, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_fraction = evict_fraction
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            Path(db_dir).mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+        self._count = self._count_rows()
+
+    def _count_rows(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._count -= self._conn.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Any, expires_at: float):
+        try:
+            encoded = json.dumps(value)
+        except (TypeError, ValueError):
+            logger.debug(f"Not caching unserializable response for {key}")
+            return
+
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE responses SET value = ?, expires_at = ?, last_used = ? WHERE key = ?",
+                (encoded, expires_at, now, key)).rowcount
+            if not updated:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, encoded, expires_at, now))
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        #Called with the lock held. Recounting afterwards keeps the count honest if another process shares the file
+        excess = self._count - self.max_entries + max(1, int(self.max_entries * self.evict_fraction))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)", (excess,))
+        self._count = self._count_rows()
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._count = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SourceTicketCache():
+    """
+    Local SQLite record of which zammad ticket belongs to which source, so posting an article
+    doesn't need a ticket search first. Entries are written whenever a ticket is created or found
+    by search, and dropped by the zammad client when the ticket turns out not to exist anymore.
+
+    Alongside the ticket id it keeps the fingerprint of the issues last posted to that ticket and the
+    state it was left in, so unchanged issues don't need posting again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            Path(db_dir).mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS source_tickets ("
+            "source_id INTEGER PRIMARY KEY, ticket_id INTEGER NOT NULL, updated_at REAL NOT NULL, "
+            "fingerprint TEXT DEFAULT NULL, state TEXT DEFAULT NULL)")
+        #Caches from before fingerprints were kept
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(source_tickets)")}
+        for column in ("fingerprint", "state"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE source_tickets ADD COLUMN {column} TEXT DEFAULT NULL")
+        self._conn.commit()
+
+    def get(self, source_id: int) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ticket_id FROM source_tickets WHERE source_id = ?", (int(source_id),)).fetchone()
+        return None if row is None else row[0]
+
+    def get_many(self, source_ids: List[int]) -> Dict[int, int]:
+        """
+        {source_id: ticket_id} for the given sources which have an entry
+        """
+        source_ids = [int(s) for s in source_ids]
+        tickets = {}
+        with self._lock:
+            #Stay well under sqlite's limit on query parameters
+            for i in range(0, len(source_ids), 500):
+                batch = source_ids[i:i + 500]
+                placeholders = ", ".join(["?"] * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT source_id, ticket_id FROM source_tickets WHERE source_id IN ({placeholders})", batch)
+                tickets.update(rows.fetchall())
+        return tickets
+
+    def set(self, source_id: int, ticket_id: int):
+        self.set_many({source_id: ticket_id})
+
+    def set_many(self, tickets: Dict[int, int]):
+        now = time.time()
+        with self._lock:
+            #A source moving to a different ticket hasn't had anything posted to the new one yet
+            self._conn.executemany(
+                "INSERT INTO source_tickets (source_id, ticket_id, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (source_id) DO UPDATE SET "
+                "fingerprint = CASE WHEN ticket_id = excluded.ticket_id THEN fingerprint END, "
+                "state = CASE WHEN ticket_id = excluded.ticket_id THEN state END, "
+                "ticket_id = excluded.ticket_id, updated_at = excluded.updated_at",
+                [(int(s), int(t), now) for s, t in tickets.items()])
+            self._conn.commit()
+
+    def get_posted(self, source_id: int) -> Optional[Tuple[str, str]]:
+        """
+        (fingerprint, state) of the last article posted for the source, if there's one on record
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, state FROM source_tickets WHERE source_id = ? AND fingerprint IS NOT NULL",
+                (int(source_id),)).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def set_posted(self, source_id: int, fingerprint: str, state: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE source_tickets SET fingerprint = ?, state = ?, updated_at = ? WHERE source_id = ?",
+                (fingerprint, state, time.time(), int(source_id)))
+            self._conn.commit()
+
+    def invalidate(self, source_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM source_tickets WHERE source_id = ?", (int(source_id),))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM source_tickets").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM source_tickets")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,4 +1,5 @@
 import datetime as dt
+import pandas as pd
 
 class SourcePayload():
     """
@@ -103,3 +104,11 @@ class CollectionPayload():
         return f"CollectionPayload({self.name})"
 
 
+def payloads_to_frame(payloads: list, index: str = "id") -> pd.DataFrame:
+    """
+    One row per payload, one column per payload field, for the columnar issue checks.
+    """
+    frame = pd.DataFrame([{k: v for k, v in vars(p).items() if k != "issues"} for p in payloads])
+    if index and index in frame.columns:
+        frame = frame.set_index(index, drop=False)
+    return frame
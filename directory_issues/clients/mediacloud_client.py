@@ -0,0 +1,101 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import mediacloud.api as mc_api
+
+
+class PooledApiMixin():
+    #Quick minimal extension to the mediacloud api clients:
+    #share one keep-alive session, serve GETs from a response cache when one is set,
+    #and wait on a rate limiter before each request that does go out
+
+    def _configure(self, session:requests.Session, timeout:float, rate_limiter=None, cache=None, base_url=None):
+        self._session.close()
+        self._session = session
+        if base_url:
+            self.BASE_API_URL = base_url
+        self.TIMEOUT_SECS = timeout
+        self._rate_limiter = rate_limiter
+        self._cache = cache
+
+    def _query(self, endpoint, params=None, method='GET'):
+        use_cache = self._cache is not None and method == 'GET'
+        if use_cache:
+            cached = self._cache.get(endpoint, params)
+            if cached is not None:
+                return cached
+
+        if self._rate_limiter is not None:
+            self._rate_limiter.wait(self.BASE_API_URL)
+        response = super()._query(endpoint, params, method)
+
+        if use_cache:
+            self._cache.set(endpoint, params, response)
+        return response
+
+
+class PooledDirectoryApi(PooledApiMixin, mc_api.DirectoryApi):
+    pass
+
+
+class PooledSearchApi(PooledApiMixin, mc_api.SearchApi):
+    pass
+
+
+class MediaCloudClients():
+    """
+    Process-wide registry of Directory and Search api clients.
+    Both clients are created lazily and share a single requests session with a pooled adapter,
+    so concurrent callers reuse open connections instead of paying a TLS handshake per request.
+    """
+
+    def __init__(self, api_token:str|None, pool_size:int = 16, timeout:float = 60, rate_limiter = None, cache = None,
+            base_url:str|None = None):
+        self.api_token = api_token
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        #Any ResponseCache, or None to always go to the api
+        self.cache = cache
+        #Root of the api, e.g. a local fake for benchmarking. None uses mediacloud's own default
+        self.base_url = base_url
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._directory = None
+        self._search = None
+
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            session = requests.Session()
+            session.headers.update({'Authorization': f'Token {self.api_token}'})
+            session.headers.update({'Accept': 'application/json'})
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def directory(self) -> PooledDirectoryApi:
+        with self._lock:
+            if self._directory is None:
+                client = PooledDirectoryApi(self.api_token)
+                client._configure(self._get_session(), self.timeout, self.rate_limiter, self.cache, self.base_url)
+                self._directory = client
+            return self._directory
+
+    def search(self) -> PooledSearchApi:
+        with self._lock:
+            if self._search is None:
+                client = PooledSearchApi(self.api_token)
+                client._configure(self._get_session(), self.timeout, self.rate_limiter, self.cache, self.base_url)
+                self._search = client
+            return self._search
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._directory = None
+            self._search = None
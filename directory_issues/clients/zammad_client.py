@@ -1,6 +1,14 @@
+import logging
 from zammad_py import ZammadAPI
-from zammad_py.api import Resource 
+from zammad_py.api import Resource, Ticket
 from pydantic_settings import BaseSettings
+from requests import HTTPError
+from requests.adapters import HTTPAdapter
+
+from ..cache import SourceTicketCache
+from ..concurrency import ordered_map
+
+logger = logging.getLogger(__name__)
 
 
 class ZammadConfig(BaseSettings):
@@ -9,6 +17,15 @@ class ZammadConfig(BaseSettings):
     default_zammad_group:str="Users"
     default_zammad_user:str="Directory Detective"
     default_zammad_email:str="support@mediacloud.org"
+    #Tickets created or updated in parallel by post_source_articles
+    zammad_max_workers:int=8
+    #Keep-alive connections held open to zammad, should be at least zammad_max_workers
+    zammad_pool_size:int=16
+    #Sources looked up per ticket search when prefetching source->ticket ids
+    zammad_search_batch_size:int=50
+    #Local record of source->ticket ids, so posting to a known source skips the ticket search
+    zammad_ticket_cache_enabled:bool=True
+    zammad_ticket_cache_path:str="/tmp/directory_issues/zammad_tickets.db"
 
 config = ZammadConfig()
 
@@ -27,14 +44,37 @@ class Tag(Resource):
         return self._raise_or_return_json(response)
 
 
+class TicketResource(Ticket):
+    #zammad_py drops the response when raising, keep it so callers can tell a 404 from other errors
+
+    def _raise_or_return_json(self, response):
+        try:
+            response.raise_for_status()
+        except HTTPError:
+            raise HTTPError(response.text, response=response)
+        return super()._raise_or_return_json(response)
+
+
+def is_not_found(error:HTTPError) -> bool:
+    return error.response is not None and error.response.status_code == 404
+
+
 class ZammadClient():
-    def __init__(self):
-        
+    def __init__(self, ticket_cache:SourceTicketCache|None = None, url:str|None = None, token:str|None = None):
+        #url and token default to the configured zammad instance
         self.client = ZammadAPI(
-                url=config.zammad_url, 
-                http_token=config.zammad_token)
+                url=url or config.zammad_url, 
+                http_token=token or config.zammad_token)
+        #The session is shared by all of our worker threads, so give it a pool big enough for them
+        adapter = HTTPAdapter(pool_connections=config.zammad_pool_size, pool_maxsize=config.zammad_pool_size)
+        self.client.session.mount("https://", adapter)
+        self.client.session.mount("http://", adapter)
         self.tag_client = Tag(connection=self.client)
+        self.tickets = TicketResource(connection=self.client)
 
+        if ticket_cache is None and config.zammad_ticket_cache_enabled:
+            ticket_cache = SourceTicketCache(config.zammad_ticket_cache_path)
+        self.ticket_cache = ticket_cache
 
 
     def new_ticket(self,
@@ -43,9 +83,10 @@ class ZammadClient():
             source_id:int,
             collections:str,
             send_email:bool=False,
-            tags = []):
+            tags = [],
+            state:str|None=None):
         """
-        Create a new ticket for a source
+        Create a new ticket for a source, in zammad's default state unless one is given
         #NB: source_article should be preferred when generating issues
         # rather than proliferating tickets, keep successive updates in the same ticket
         # at least for now
@@ -65,10 +106,15 @@ class ZammadClient():
             },
             "send_email":send_email
         }
+        if state is not None:
+            params["state"] = state
+        #Tags go in with the ticket rather than as one tag_ticket call each
+        if tags:
+            params["tags"] = ",".join(tags)
 
-        response = self.client.ticket.create(params=params)
-        for tag in tags:
-            self.tag_client.tag_ticket(response["id"], tag)
+        response = self.tickets.create(params=params)
+        if self.ticket_cache is not None:
+            self.ticket_cache.set(source_id, response["id"])
         return response
 
     #Set option to close an article too?
@@ -78,30 +124,98 @@ class ZammadClient():
             source_id:int,
             collections:str,
             send_email:bool=False,
-            state="open"
+            state="open",
+            fingerprint:str|None=None,
+            force:bool=False
             ):
         """
         Update a ticket for a source with a new article, and reopen it. 
         First find the ticket (create one if it doesn't exist yet)
         Then create the article
-        
+
+        With a fingerprint of the issues in the article, nothing is posted (and None is returned) if the
+        same fingerprint was last posted to the source's ticket and left it in the same state, unless force.
         """
-        #Get the id of the exiting ticket for this source:
-        ticket_page = self.client.ticket.search(f"source:{source_id}")
+        if not force and self.is_unchanged(source_id, fingerprint, state):
+            logger.info(f"Issues for source {source_id} are unchanged, not posting")
+            return None
+        ticket_id = self.ticket_for_source(source_id)
+        action, _, response = self._post_source_ticket(
+            ticket_id, source_id, article_message, article_title, collections, send_email, state)
+        self._record_posted(source_id, fingerprint, state)
+        return response
+
+    def is_unchanged(self, source_id:int, fingerprint:str|None, state:str) -> bool:
+        if fingerprint is None or self.ticket_cache is None:
+            return False
+        return self.ticket_cache.get_posted(source_id) == (fingerprint, state)
+
+    def _record_posted(self, source_id:int, fingerprint:str|None, state:str):
+        if fingerprint is not None and self.ticket_cache is not None:
+            self.ticket_cache.set_posted(source_id, fingerprint, state)
 
+    def ticket_for_source(self, source_id:int) -> int|None:
+        """
+        The id of the ticket for a source, from the ticket cache if we have it, otherwise by search.
+        """
+        if self.ticket_cache is not None:
+            ticket_id = self.ticket_cache.get(source_id)
+            if ticket_id is not None:
+                return ticket_id
+        return self._search_source_ticket(source_id)
+
+    def _search_source_ticket(self, source_id:int) -> int|None:
+        #Get the id of the exiting ticket for this source:
+        ticket_page = self.tickets.search(f"source:{source_id}")
         if len(ticket_page) == 0:
-            #If there aint no ticket, make one
-            return self.new_ticket(
-                article_message,
-                article_title,
-                source_id,
-                collections,
-                send_email,
-                ["source"]
-                )
+            return None
 
         ticket_id = ticket_page[0]['id']
+        if self.ticket_cache is not None:
+            self.ticket_cache.set(source_id, ticket_id)
+        return ticket_id
+
+    def _post_source_ticket(self, ticket_id:int|None, source_id:int, article_message:str, article_title:str,
+            collections:str, send_email:bool, state:str) -> tuple[str, int, dict]:
+        #Add the article to ticket_id, or to a new ticket if there isn't one. 
+        #A cached ticket which has since been deleted is dropped from the cache, and searched for again
+        if ticket_id is not None:
+            try:
+                return "updated", ticket_id, self.update_ticket(
+                    ticket_id, article_message, article_title, collections, send_email, state)
+            except HTTPError as e:
+                if not is_not_found(e):
+                    raise
+                logger.info(f"Ticket {ticket_id} for source {source_id} no longer exists")
+                if self.ticket_cache is not None:
+                    self.ticket_cache.invalidate(source_id)
+                ticket_id = self._search_source_ticket(source_id)
+                if ticket_id is not None:
+                    return "updated", ticket_id, self.update_ticket(
+                        ticket_id, article_message, article_title, collections, send_email, state)
+
+        #If there aint no ticket, make one
+        response = self.new_ticket(
+            article_message,
+            article_title,
+            source_id,
+            collections,
+            send_email,
+            ["source"],
+            state
+            )
+        return "created", response["id"], response
 
+    def update_ticket(self,
+            ticket_id:int,
+            article_message:str,
+            article_title:str,
+            collections:str,
+            send_email:bool=False,
+            state="open"):
+        """
+        Add an article to an existing ticket, setting its state
+        """
         params = {
             "collections":collections, 
             "article": {
@@ -115,9 +229,83 @@ class ZammadClient():
             "send_email":send_email
         }
 
-        response = self.client.ticket.update(id=ticket_id, params=params)
+        response = self.tickets.update(id=ticket_id, params=params)
         return response
 
+    def find_source_tickets(self, source_ids:list[int], batch_size:int|None = None) -> dict[int, int]:
+        """
+        Map source ids to the id of their ticket, for every source which has one.
+        Sources are looked up batch_size at a time with an OR'd search, paging through the results,
+        rather than with one search per source. Like source_article, the first ticket found for a source wins.
+        """
+        batch_size = batch_size or config.zammad_search_batch_size
+        wanted = {int(s) for s in source_ids}
+        tickets = {}
+        if self.ticket_cache is not None:
+            tickets = self.ticket_cache.get_many(list(wanted))
+        found = {}
+        #Only the sources we don't already know the ticket for need searching
+        source_ids = sorted(wanted - set(tickets))
+        #client.ticket always pages by 10, so make our own with a page per batch
+        ticket_resource = TicketResource(connection=self.client, per_page=batch_size)
+        for i in range(0, len(source_ids), batch_size):
+            batch = source_ids[i:i + batch_size]
+            query = "source:(" + " OR ".join(str(s) for s in batch) + ")"
+            page = ticket_resource.search(query)
+            while len(page) > 0:
+                for ticket in page:
+                    try:
+                        source_id = int(ticket.get("source"))
+                    except (TypeError, ValueError):
+                        continue
+                    if source_id in wanted and source_id not in tickets and source_id not in found:
+                        found[source_id] = ticket["id"]
+                if len(page) < batch_size:
+                    break
+                page = page.next_page()
+
+        if found and self.ticket_cache is not None:
+            self.ticket_cache.set_many(found)
+        tickets.update(found)
+        return tickets
+
+    def post_source_articles(self, articles:list[dict], send_email:bool=False,
+            max_workers:int|None = None, force:bool=False) -> list[dict]:
+        """
+        source_article for many sources at once. Each article is a dict with source_id, message, title,
+        collections, state and optionally fingerprint (see Source.zammad_article). Articles whose fingerprint
+        and state match what was last posted are skipped, unless force. Existing tickets for the rest are found 
+        up front with find_source_tickets, then tickets are created or updated on max_workers threads sharing one session.
+
+        Returns one outcome per article, in order: {"source_id", "action", "ticket_id", "error"}, where action
+        is "created", "updated", "skipped" or "failed". A failure doesn't stop the other articles from being posted.
+        """
+        if max_workers is None:
+            max_workers = config.zammad_max_workers
+
+        unchanged = set()
+        if not force:
+            unchanged = {a["source_id"] for a in articles
+                         if self.is_unchanged(a["source_id"], a.get("fingerprint"), a.get("state", "open"))}
+        tickets = self.find_source_tickets([a["source_id"] for a in articles if a["source_id"] not in unchanged])
+
+        def post(article):
+            source_id = article["source_id"]
+            if source_id in unchanged:
+                return {"source_id": source_id, "action": "skipped", "ticket_id": None, "error": None}
+            ticket_id = tickets.get(int(source_id))
+            state = article.get("state", "open")
+            try:
+                action, ticket_id, _ = self._post_source_ticket(ticket_id, source_id, article["message"],
+                    article["title"], article["collections"], send_email, state)
+                self._record_posted(source_id, article.get("fingerprint"), state)
+                return {"source_id": source_id, "action": action, "ticket_id": ticket_id, "error": None}
+            except Exception as e:
+                logger.warning(f"Error posting zammad article for source {source_id}: {e}")
+                return {"source_id": source_id, "action": "failed", "ticket_id": ticket_id, "error": str(e)}
+
+        return ordered_map(post, articles, max_workers=max_workers)
+
 
     def collection_article(self,
             article_message:str,
@@ -0,0 +1,68 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+from urllib.parse import urlparse
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class RateLimiter():
+    """
+    Thread-safe limiter which spaces out calls so that no more than
+    `per_second` of them start in any one second. A falsy rate disables limiting.
+    """
+
+    def __init__(self, per_second: Optional[float] = None):
+        self.per_second = per_second
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.per_second:
+            return
+
+        interval = 1.0 / self.per_second
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class HostRateLimiter():
+    """
+    One RateLimiter per host, so that requests to different hosts don't throttle each other
+    """
+
+    def __init__(self, per_second: Optional[float] = None):
+        self.per_second = per_second
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def for_host(self, url: str) -> RateLimiter:
+        host = urlparse(url).netloc or url
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = RateLimiter(self.per_second)
+            return self._limiters[host]
+
+    def wait(self, url: str):
+        self.for_host(url).wait()
+
+
+def ordered_map(fn: Callable[[T], R], items: Iterable[T], max_workers: int = 1) -> List[R]:
+    """
+    Apply fn to every item using a bounded thread pool, returning results in input order.
+    Falls back to a plain loop when max_workers is 1 or less.
+    """
+    items = list(items)
+    if max_workers is None or max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(fn, items))
@@ -1,5 +1,7 @@
 import logging
-from typing import TypeVar, Tuple, Generic, Type, Dict, Callable, List, Any
+import threading
+from typing import TypeVar, Tuple, Generic, Type, Dict, Callable, List, Any, Optional, Iterable, Iterator
+import pandas as pd
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
@@ -25,6 +27,9 @@ class IssueBase(Generic[T]):
             issue_cls._tags = tags
             issue_cls.issue_name = issue_name
             cls._ISSUES[issue_name] = issue_cls
+            # Registering changes which issues a plan should hold, so drop the cached ones
+            with _PLANS_LOCK:
+                _PLANS.clear()
             return issue_cls
         return decorator
 
@@ -32,9 +37,53 @@ class IssueBase(Generic[T]):
         """Override this method in subclasses to perform issue calculation."""
         raise NotImplementedError("Subclasses must implement this method.")
 
+    def calculate_frame(self, frame: pd.DataFrame) -> Tuple[pd.Series, Optional[Any]]:
+        """
+        Optionally override in subclasses to calculate the issue for every row of a frame at once.
+        Return a boolean Series (aligned with frame.index) marking the hits, plus the result data for
+        render_template: a DataFrame whose rows become the result dicts, a Series of per-row results, or None.
+        Rows left NA in the hits (e.g. values calculate can't handle) are run through calculate one at a time,
+        so they get exactly the per-payload result, errors included.
+        """
+        raise NotImplementedError("Subclasses may implement this method.")
+
+    @classmethod
+    def is_vectorized(cls) -> bool:
+        return cls.calculate_frame is not IssueBase.calculate_frame
+
+    def calculate_rows(self, frame: pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
+        """
+        Fallback for issues without calculate_frame: run calculate on each row. 
+        Rows are namedtuples, so attribute access works the same as on a payload.
+        """
+        hits = []
+        results = []
+        for row in frame.itertuples():
+            is_issue, result_data = self.calculate(row)
+            hits.append(bool(is_issue))
+            results.append(result_data)
+        return pd.Series(hits, index=frame.index, dtype=bool), pd.Series(results, index=frame.index, dtype=object)
+
+    @staticmethod
+    def string_column(frame: pd.DataFrame, column: str) -> pd.Series:
+        #Nullable string view of a column, so .str methods work even if every value is None
+        return frame[column].astype("string")
+
     def render_template(self) -> str:
         return f"Default {self._name} result" 
 
+    @classmethod
+    def plan(cls, include_tags: List[str] = None, exclude_tags: List[str] = None) -> "IssuePlan":
+        """
+        The compiled IssuePlan for this registry and tag filter. Plans are cached, 
+        so repeated calls with the same filter share one plan.
+        """
+        key = (cls, _tag_key(include_tags), _tag_key(exclude_tags))
+        with _PLANS_LOCK:
+            if key not in _PLANS:
+                _PLANS[key] = IssuePlan(cls._ISSUES, include_tags=include_tags, exclude_tags=exclude_tags)
+            return _PLANS[key]
+
     @classmethod
     def calculate_all(
         cls, 
@@ -45,37 +94,147 @@ class IssueBase(Generic[T]):
         """
         Calculate all issues matching include_tags and not matching exclude_tags
         """
-        results = []
-        for issue_name, issue_cls in cls._ISSUES.items():
-            issue_tags = issue_cls._tags
+        return cls.plan(include_tags, exclude_tags).calculate(payload)
+
+    @classmethod
+    def calculate_all_frame(
+        cls,
+        frame: pd.DataFrame,
+        include_tags: List[str] = None,
+        exclude_tags: List[str] = None
+    ) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+        """
+        Columnar version of calculate_all, for a frame with one row per payload (see payloads_to_frame).
+        Returns a boolean issue matrix (frame.index x issue names) and the rendered results for hits only,
+        each carrying the frame index of its row. Issues without calculate_frame fall back to a per-row loop.
+        An issue which errors on a single row gets an error result with that row's index, as calculate_all would.
+        An issue which errors over the whole frame gets an all-False column and a single error result with index None.
+        """
+        return cls.plan(include_tags, exclude_tags).calculate_frame(frame)
+
+
+_PLANS: Dict[tuple, "IssuePlan"] = {}
+_PLANS_LOCK = threading.Lock()
+
+
+def _tag_key(tags: Optional[List[str]]) -> Optional[frozenset]:
+    return None if tags is None else frozenset(tags)
+
+
+class IssuePlan():
+    """
+    The issues from a registry which pass a tag filter, selected once so a stream of payloads
+    can be checked without re-walking the registry. Issue instances are reused between payloads,
+    one set per thread.
+    """
+
+    def __init__(self, registry: Dict[str, Type[IssueBase]], include_tags: List[str] = None, exclude_tags: List[str] = None):
+        include = _tag_key(include_tags)
+        exclude = _tag_key(exclude_tags)
+
+        self.issues: List[Tuple[str, Type[IssueBase]]] = []
+        for issue_name, issue_cls in registry.items():
+            issue_tags = set(issue_cls._tags)
 
             # Check for inclusion: If include_tags is None, include all metrics.
-            if include_tags is not None and not any(tag in include_tags for tag in issue_tags):
-                continue  
-            
+            if include is not None and not (issue_tags & include):
+                continue
+
             # Check for exclusion: If exclude_tags are provided, skip if any tag matches.
-            if exclude_tags is not None and any(tag in exclude_tags for tag in issue_tags):
-                continue  
-                
+            if exclude is not None and (issue_tags & exclude):
+                continue
+
+            self.issues.append((issue_name, issue_cls))
+
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f"IssuePlan({[name for name, _ in self.issues]})"
+
+    def __len__(self):
+        return len(self.issues)
+
+    def _instances(self) -> List[IssueBase]:
+        instances = getattr(self._local, "instances", None)
+        if instances is None:
+            instances = [issue_cls() for _, issue_cls in self.issues]
+            self._local.instances = instances
+        return instances
+
+    @staticmethod
+    def _error_result(issue_name: str, issue_cls: Type[IssueBase], e: Exception) -> Dict[str, Any]:
+        return {
+            "issue_name": issue_name,
+            "tags": issue_cls._tags,
+            "error": True,
+            "error_message": str(e),  # Include the error message in the result
+            "template": f"An error occurred while calculating '{issue_name}'"
+        }
+
+    def _calculate_one(self, issue_name: str, issue_cls: Type[IssueBase], issue_instance: IssueBase,
+            payload: Any) -> Optional[Dict[str, Any]]:
+        try:
+            is_issue, result_data = issue_instance.calculate(payload)
+            issue_instance.result = result_data  # Store the result on the instance
+            if is_issue:
+                # Return issue info with rendered template if the issue is present
+                return {
+                    "issue_name": issue_name,
+                    "template": issue_instance.render_template(),
+                    "tags": issue_cls._tags
+                }
+        except Exception as e:
+            logger.warning(f"Error calculating issue {issue_name} for payload {payload}: {str(e)}", exc_info=True)
+            return self._error_result(issue_name, issue_cls, e)
+        return None
+
+    def calculate(self, payload: Any) -> List[Dict[str, Any]]:
+        results = []
+        for (issue_name, issue_cls), issue_instance in zip(self.issues, self._instances()):
+            result = self._calculate_one(issue_name, issue_cls, issue_instance, payload)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def calculate_many(self, payloads: Iterable[Any]) -> Iterator[List[Dict[str, Any]]]:
+        for payload in payloads:
+            yield self.calculate(payload)
+
+    def calculate_frame(self, frame: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+        matrix = pd.DataFrame(index=frame.index)
+        results = []
+        for (issue_name, issue_cls), issue_instance in zip(self.issues, self._instances()):
             try:
-                issue_instance = issue_cls()  # Instantiate the issue
-                is_issue, result_data = issue_instance.calculate(payload)
-                issue_instance.result = result_data  # Store the result on the instance
-                if is_issue:
-                    # Append issue info with rendered template if the issue is present
+                if issue_cls.is_vectorized():
+                    hits, result_data = issue_instance.calculate_frame(frame)
+                else:
+                    hits, result_data = issue_instance.calculate_rows(frame)
+                undecided = hits.isna()
+                hits = hits.fillna(False).astype(bool)
+                matrix[issue_name] = hits
+
+                for index in hits.index[hits]:
+                    if isinstance(result_data, pd.DataFrame):
+                        issue_instance.result = result_data.loc[index].to_dict()
+                    elif isinstance(result_data, pd.Series):
+                        issue_instance.result = result_data.loc[index]
+                    else:
+                        issue_instance.result = None
                     results.append({
+                        "index": index,
                         "issue_name": issue_name,
                         "template": issue_instance.render_template(),
                         "tags": issue_cls._tags
                     })
-            except Exception as e:
-                logger.warn(f"Error calculating issue {issue_name} for payload {payload}: {str(e)}", exc_info=True)
-                results.append({
-                    "issue_name": issue_name,
-                    "tags": issue_cls._tags,
-                    "error": True,
-                    "error_message": str(e),  # Include the error message in the result
-                    "template": f"An error occurred while calculating '{issue_name}'"
-                })
-        return results
 
+                # The rows the columnar check left to the per-payload one
+                for index, row in zip(frame.index[undecided], frame[undecided].itertuples()):
+                    result = self._calculate_one(issue_name, issue_cls, issue_instance, row)
+                    if result is not None:
+                        matrix.loc[index, issue_name] = not result.get("error", False)
+                        results.append({"index": index, **result})
+            except Exception as e:
+                logger.warning(f"Error calculating issue {issue_name} over frame: {str(e)}", exc_info=True)
+                matrix[issue_name] = False
+                results.append({"index": None, **self._error_result(issue_name, issue_cls, e)})
+        return matrix, results
@@ -1,6 +1,7 @@
 from . import IssueBase
 from typing import TypeVar, Tuple, Generic, Type, Dict, Callable, List, Any
 import datetime as dt
+import pandas as pd
 
 from ..classes import SourcePayload
 
@@ -18,6 +19,11 @@ class USSPrefix(SourceIssue):
         
         return False, None
 
+    def calculate_frame(self, frame:pd.DataFrame):
+        uss = self.string_column(frame, "url_search_string")
+        #An empty string is left to calculate, which errors on it
+        return uss.str.startswith("*").fillna(False).mask(uss.eq("").fillna(False)), None
+
     def render_template(self):
         return "url_search_string starts with '*'. Remove this prefix wildcard. "
 
@@ -37,6 +43,12 @@ class HTTPPrefix(SourceIssue):
 
         return False, None
 
+    def calculate_frame(self, frame:pd.DataFrame):
+        uss = self.string_column(frame, "url_search_string")
+        https = uss.str.startswith("https").fillna(False)
+        scheme = pd.Series("http", index=frame.index).where(~https, "https")
+        return uss.str.startswith("http").fillna(False), pd.DataFrame({"scheme": scheme})
+
     def render_template(self):
         return f"url_search_string starts with {self.result['scheme']}. Remove the prefix http scheme."
 
@@ -49,6 +61,11 @@ class USSPostfix(SourceIssue):
             return True, None
         return False, None
 
+    def calculate_frame(self, frame:pd.DataFrame):
+        uss = self.string_column(frame, "url_search_string")
+        #An empty string is left to calculate, which errors on it
+        return (~uss.str.endswith("*")).fillna(False).mask(uss.eq("").fillna(False)), None
+
     def render_template(self):
         return "url_search_string does not end in '*'. Add a postfix wildcard."
 
@@ -62,6 +79,10 @@ class EmptyUSS(SourceIssue):
 
         return False, None
 
+    def calculate_frame(self, frame:pd.DataFrame):
+        uss = self.string_column(frame, "url_search_string")
+        return uss.eq("").fillna(False), None
+
     def render_template(self):
         return "url_search_string is an empty string."
 
@@ -75,6 +96,12 @@ class BadName(SourceIssue):
 
         return False, None
 
+    def calculate_frame(self, frame:pd.DataFrame):
+        name = self.string_column(frame, "name")
+        #A missing name stays NA, so calculate reports the error for it
+        bad = name.str.contains(" ", regex=False) | ~name.str.contains(".", regex=False)
+        return bad, pd.DataFrame({"name": frame["name"]})
+
     def render_template(self):
         return f"Source name ({self.result['name']}) is not a valid canonical domain"
 
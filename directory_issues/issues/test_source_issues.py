@@ -0,0 +1,70 @@
+"""
+The columnar SourceIssue checks (calculate_all_frame) against the per-payload ones (calculate_all),
+which they must agree with row for row, errors included.
+
+    python -m pytest directory_issues/issues/test_source_issues.py
+"""
+from collections import defaultdict
+
+import pytest
+
+from ..classes import SourcePayload, payloads_to_frame
+from .source_issues import SourceIssue
+
+NAMES = ["example.com", "bad name.com", "nodot", "", None]
+URL_SEARCH_STRINGS = [None, "", "example.com/local/*", "*example.com/*", "http://example.com/*",
+    "https://example.com/*", "example.com/local"]
+
+
+def make_payloads():
+    payloads = []
+    for name in NAMES:
+        for url_search_string in URL_SEARCH_STRINGS:
+            payloads.append(SourcePayload({
+                "id": len(payloads) + 1,
+                "name": name,
+                "url_search_string": url_search_string,
+                "created_at": "2024-01-01T00:00:00Z",
+                "modified_at": "2024-01-01T00:00:00Z",
+            }))
+    return payloads
+
+
+def summarize(results):
+    return sorted((r["issue_name"], r["template"], r.get("error", False)) for r in results)
+
+
+def test_frame_matches_scalar():
+    payloads = make_payloads()
+    _, frame_results = SourceIssue.calculate_all_frame(payloads_to_frame(payloads))
+
+    by_index = defaultdict(list)
+    for result in frame_results:
+        assert result["index"] is not None, f"{result['issue_name']} failed over the whole frame"
+        by_index[result["index"]].append(result)
+
+    for payload in payloads:
+        assert summarize(by_index[payload.id]) == summarize(SourceIssue.calculate_all(payload)), payload
+
+
+@pytest.mark.parametrize("name, url_search_string, issue_name, error", [
+    (None, "example.com/*", "bad-name", True),
+    ("example.com", "", "USS-*-Postfix", True),
+    ("example.com", "", "USS-*-Prefix", True),
+    ("example.com", "", "Empty-USS", False),
+    ("example.com", None, "USS-*-Postfix", None),
+])
+def test_missing_and_empty_values(name, url_search_string, issue_name, error):
+    #error None means the issue isn't reported at all
+    payload = SourcePayload({"id": 1, "name": name, "url_search_string": url_search_string,
+        "created_at": "2024-01-01T00:00:00Z", "modified_at": "2024-01-01T00:00:00Z"})
+    matrix, results = SourceIssue.calculate_all_frame(payloads_to_frame([payload]))
+
+    found = [r for r in results if r["issue_name"] == issue_name]
+    if error is None:
+        assert found == []
+        assert not matrix.loc[1, issue_name]
+    else:
+        assert [r.get("error", False) for r in found] == [error]
+        assert found[0]["index"] == 1
+        assert matrix.loc[1, issue_name] == (not error)
@@ -1,12 +1,13 @@
 import json
 import logging
 import os
-from time import sleep
-from urllib.parse import quote, urljoin
+from urllib.parse import quote, urlencode, urljoin
 
 from bs4 import BeautifulSoup
 
 from utils.database import SQLiteMixin
+from utils.page_cache import PageCache
+from utils.retry import host_for
 from utils.scraper import BaseScraper
 
 logger = logging.getLogger(__name__)
@@ -44,71 +45,103 @@ class LocalNewsInitiativeScraper(SQLiteMixin, BaseScraper):
             'fips': 'TEXT',
             'url': 'TEXT'
         })
-
+        self.page_cache = PageCache(self)
 
     def fetch_sources(self):
         response = self.scraper.get(urljoin(self.base_url, URLs.get("SOURCES_LIST")))
         sources = response.json()
 
-        for source in sources:
-            logging.info(f"Recording source {source.get('id')} - {source.get('mediaName')}")
-            self.insert("sources", {
-                "state": source.get("state"),
-                "county": source.get("county"),
-                "media_name": source.get("mediaName"),
-                "media_type": source.get("mediaType"),
-                "year_loaded": source.get("yearLoaded"),
-                "fips": source.get("fips"),
-            })
+        with self.transaction():
+            for source in sources:
+                logging.info(f"Recording source {source.get('id')} - {source.get('mediaName')}")
+                self.insert("sources", {
+                    "state": source.get("state"),
+                    "county": source.get("county"),
+                    "media_name": source.get("mediaName"),
+                    "media_type": source.get("mediaType"),
+                    "year_loaded": source.get("yearLoaded"),
+                    "fips": source.get("fips"),
+                })
+
+    def search_string(self, source):
+        return f"{self.get_state_name(source.get('state'))} {source.get('county')} {source.get('media_name')} newspaper official website"
 
-    def fetch_source_url(self, query):
-        try:
-            params = {"q": quote(query)}
-            response = self.scraper.get(URLs.get("SEARCH_ENGINE_URL"), params=params)
-            soup = BeautifulSoup(response.text, features="lxml")
-            results = soup.find_all('div', class_='result')
-
-            for result_div in results:
-                extras_url_div = result_div.find('div', class_='result__extras__url')
-                if extras_url_div:
-                    link = extras_url_div.find('a', class_='result__url')
-                    if link:
-                        link_text = link.text.strip()
-                        if "facebook" not in link_text and "wikipedia" not in link_text:
-                            return link_text
-        except Exception as e:
-            logger.exception(e)
+    @staticmethod
+    def search_url(query):
+        # The query is quoted once more than urlencode alone would, as it always has been
+        return f"{URLs.get('SEARCH_ENGINE_URL')}?{urlencode({'q': quote(query)})}"
 
+    @staticmethod
+    def parse_source_url(text):
+        soup = BeautifulSoup(text, features="lxml")
+        results = soup.find_all('div', class_='result')
+
+        for result_div in results:
+            extras_url_div = result_div.find('div', class_='result__extras__url')
+            if extras_url_div:
+                link = extras_url_div.find('a', class_='result__url')
+                if link:
+                    link_text = link.text.strip()
+                    if "facebook" not in link_text and "wikipedia" not in link_text:
+                        return link_text
         return None
 
+    def parse_search_response(self, source, response):
+        url = self.search_url(self.search_string(source))
+        return self.parse_page(url, self.require_ok(response), self.parse_source_url)
+
+    def search_source_url(self, url):
+        return self.parse_page(url, self.require_ok(self.get_page(url)), self.parse_source_url)
+
+    def fetch_source_url(self, query):
+        # Retried like the async fetcher: transient statuses and empty results are tried again, blocks aren't
+        url = self.search_url(query)
+        return self.scrape_content_with_retry(self.search_source_url, url, host=host_for(url))
+
     def fetch_source_metadata(self):
-        sources = self.select("sources", where="url IS NULL")
-        if len(sources) > 0:
-            for source in sources:
-                search_string = f"{self.get_state_name(source.get('state'))} {source.get('county')} {source.get('media_name')} newspaper official website"
-                logging.info("Attempting to fetch url for: %s - %s", source.get("id"), search_string)
-                source_url = self.fetch_source_url(search_string)
-                if source_url:
-                    logger.info("Completed fetching URL from %s", search_string)
-                    self.update("sources", {"url": source_url, }, "id = ?",
-                                (source.get("id"),))
-                else:
-                    raise Exception("No URL fetched, possibly blocked")
-                logging.info("Crawl delay. Waiting for %s seconds...", self.crawl_delay)
-                sleep(self.crawl_delay)
+        sources = self.iter_select("sources", where="url IS NULL")
+        # The per-host rate (one search per crawl delay unless --requests-per-second) is kept by get_page
+        if self.async_fetch:
+            scheduler = self.async_fetcher()
+            crawled = scheduler.run(sources, lambda source: self.search_url(self.search_string(source)),
+                                    self.parse_search_response)
         else:
+            scheduler = self.crawl_scheduler()
+            crawled = scheduler.run(sources, lambda source: self.fetch_source_url(self.search_string(source)),
+                                    lambda source: self.search_url(self.search_string(source)))
+
+        found_sources = False
+        blocked = False
+        for source, source_url, error in crawled:
+            found_sources = True
+            search_string = self.search_string(source)
+            if source_url:
+                logger.info("Completed fetching URL from %s", search_string)
+                self.update("sources", {"url": source_url, }, "id = ?",
+                            (source.get("id"),))
+            elif not blocked:
+                # Only once the search's retries are spent, or it was refused outright
+                logger.error("No URL fetched for %s - %s", source.get("id"), search_string)
+                # Let the searches already in flight finish, but don't start any more
+                blocked = True
+                scheduler.stop()
+
+        if blocked:
+            raise Exception("No URL fetched, possibly blocked")
+        if not found_sources:
             logger.info("All sources have been updated, exiting...")
 
     def export_sources_to_file(self):
-        sources = self.select("sources")
-        data = []
-
-        for source in sources:
-            data.append(source)
+        sources = self.iter_select("sources")
         os.makedirs(JSON_DUMP_PATH, exist_ok=True)
 
         with open(f"{JSON_DUMP_PATH}/lni_sources.json", "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
+            f.write("[")
+            for index, source in enumerate(sources):
+                if index > 0:
+                    f.write(", ")
+                json.dump(source, f, ensure_ascii=False)
+            f.write("]")
         logger.info("Data has been written to a file")
 
     def main(self):
@@ -0,0 +1,237 @@
+import json
+import re
+from typing import List
+
+from bs4 import BeautifulSoup, Comment
+
+from utils.parsing import element_after_comment, element_text, find_first, parse_html
+
+COUNTRIES_ENTRY_POINT = "START MAIN COLUMN TABLE"
+STATES_ENTRY_POINT = "START MAIN LEFT COLUMN TABLE"
+SOURCES_ENTRY_POINT = "START MAIN PAPER DISPLAY TABLE"
+SOCIAL_ENTRY_POINT = "SHOW SOCIAL ICONS AVAILABLE"
+
+
+def extract_location_totals(text: str, location_type: str):
+    if location_type == "countries":
+        pattern = r"(.*?)\s*\((\d+)\)"
+        match = re.search(pattern, text)
+        if match:
+            country = match.group(1).strip()
+            total = int(match.group(2))
+            return country, total
+    elif location_type == "states":
+        pattern = r"(.*?)\[(.*?)\]\((\d+)\)"
+        match = re.search(pattern, text)
+        if match:
+            state_name = match.group(1).strip()
+            state_abbrev = match.group(2)
+            total = int(match.group(3))
+            return state_name, state_abbrev, total
+    return None, None
+
+
+def extract_social_media_tag_info(social_media_anchor_tag):
+    social_media_info = {}
+    url = social_media_anchor_tag.get("href")
+    if "wikipedia" in url:
+        social_media_info["Wikipedia"] = url
+    elif "facebook" in url:
+        social_media_info["Facebook"] = url
+    elif "twitter" in url:
+        social_media_info["Twitter"] = url
+    return social_media_info
+
+
+def location_entry(level: str, href: str, text: str):
+    # The record for one link in a country or state list, None for links that aren't locations
+    if text == "(FP)":
+        return None
+    if level == "countries":
+        location, total = extract_location_totals(text, level)
+        if location and total:
+            return {"name": location, "url": href, "total": total}
+    elif level == "states":
+        location, abbreviation, total = extract_location_totals(text, level)
+        return {"name": location, "abbreviation": abbreviation, "url": href, "total": total}
+    return None
+
+
+def source_entry(data: dict, name: str, url: str, city: str, state: str, language: str, no_columns: int):
+    # Local sources (USA) have 3 columns, other sources have 4 columns
+    if no_columns == 4:
+        country = data.get("name")
+    else:
+        state = data.get("name")
+        country = data.get("country")
+    return {"url": url, "country": country, "state": state, "data": json.dumps({
+        "state": state,
+        "country": country,
+        "url": url,
+        "city": city,
+        "language": language,
+        "name": name
+    })}
+
+
+class SoupPageParser:
+    """
+    Parses thepaperboy pages with BeautifulSoup, building the whole tree and then scanning every comment
+    for the section markers. Kept as the reference the lxml parser is checked (and benchmarked) against.
+    """
+
+    def parse_locations(self, text: str, level: str) -> List[dict]:
+        entry_point = STATES_ENTRY_POINT if level == "states" else COUNTRIES_ENTRY_POINT
+        data = []
+        soup = BeautifulSoup(text, features="lxml")
+        comments = soup.find_all(string=lambda node: isinstance(node, Comment))
+        for comment in comments:
+            if entry_point in comment:
+                main_table = comment.find_next()
+                tables = main_table.find_all("table")
+                for table in tables:
+                    rows = table.find_all("tr")
+                    for row in rows:
+                        anchors = row.find_all("a")
+                        for anchor in anchors:
+                            entry = location_entry(level, anchor.get("href"), anchor.get_text(strip=True))
+                            if entry:
+                                data.append(entry)
+                break
+        return data
+
+    def parse_location_sources(self, text: str, data: dict) -> List[dict]:
+        fetched_data = []
+        soup = BeautifulSoup(text, features="lxml")
+        comments = soup.find_all(string=lambda text: isinstance(text, Comment))
+        for comment in comments:
+            if SOURCES_ENTRY_POINT in comment:
+                main_table = comment.find_next()
+                no_columns = 3 if data.get("country") == "United States" else 4
+                rows = main_table.find_all("tr")[1:]
+                for row in rows:
+                    cells = row.find_all("td")
+                    if len(cells) == no_columns:
+                        source_link_tag = cells[0].find("a")
+                        name = source_link_tag.get_text(strip=True)
+                        url = source_link_tag['href']
+                        city = cells[1].find("a", href=True).get_text()
+                        if no_columns == 4:
+                            state = cells[2].find("a", href=True).get_text()
+                            language = cells[3].find("font", class_="smallfont").get_text()
+                        else:
+                            state = None
+                            language = cells[2].find("font", class_="smallfont").get_text()
+                        fetched_data.append(source_entry(data, name, url, city, state, language, no_columns))
+        return fetched_data
+
+    def parse_source_metadata(self, text: str, data: dict) -> dict:
+        soup = BeautifulSoup(text, features="lxml")
+        # Get the link to the actual source website
+        source_final_link = soup.find("h1").find("a")
+        if source_final_link:
+            data["url"] = source_final_link.get('href')
+
+        # Get the description of the source (this is mostly present for USA sources)
+        pre_formatted_text = soup.find("pre")
+        if pre_formatted_text:
+            data["description"] = pre_formatted_text.text.strip()
+
+        # Get social details
+        comments = soup.find_all(string=lambda text: isinstance(text, Comment))
+        for comment in comments:
+            if SOCIAL_ENTRY_POINT in comment:
+                data["social_media"] = []
+                social_tags_container = comment.find_next()
+                if social_tags_container:
+                    social_tags = social_tags_container.find_all('a', target="_blank")
+                    for social_tag in social_tags:
+                        data["social_media"].append(extract_social_media_tag_info(social_tag))
+                break
+        return data
+
+
+class LxmlPageParser:
+    """
+    Parses thepaperboy pages with lxml directly: the section markers are found with one XPath
+    over the comments, and the list pages are only parsed from their marker onwards.
+    Produces the same records as SoupPageParser.
+    """
+
+    def parse_locations(self, text: str, level: str) -> List[dict]:
+        entry_point = STATES_ENTRY_POINT if level == "states" else COUNTRIES_ENTRY_POINT
+        data = []
+        main_table = self._section(text, entry_point)
+        if main_table is None:
+            return data
+        for table in main_table.iterdescendants("table"):
+            for row in table.iterdescendants("tr"):
+                for anchor in row.iterdescendants("a"):
+                    entry = location_entry(level, anchor.get("href"), element_text(anchor, strip=True))
+                    if entry:
+                        data.append(entry)
+        return data
+
+    def parse_location_sources(self, text: str, data: dict) -> List[dict]:
+        fetched_data = []
+        main_table = self._section(text, SOURCES_ENTRY_POINT)
+        if main_table is None:
+            return fetched_data
+        no_columns = 3 if data.get("country") == "United States" else 4
+        rows = list(main_table.iterdescendants("tr"))[1:]
+        for row in rows:
+            cells = list(row.iterdescendants("td"))
+            if len(cells) == no_columns:
+                source_link_tag = find_first(cells[0], "a")
+                name = element_text(source_link_tag, strip=True)
+                url = source_link_tag.attrib['href']
+                city = element_text(find_first(cells[1], "a", href=True))
+                if no_columns == 4:
+                    state = element_text(find_first(cells[2], "a", href=True))
+                    language = element_text(find_first(cells[3], "font", class_="smallfont"))
+                else:
+                    state = None
+                    language = element_text(find_first(cells[2], "font", class_="smallfont"))
+                fetched_data.append(source_entry(data, name, url, city, state, language, no_columns))
+        return fetched_data
+
+    def parse_source_metadata(self, text: str, data: dict) -> dict:
+        root = parse_html(text)
+        # Get the link to the actual source website
+        heading = find_first(root, "h1")
+        if heading is None:
+            raise ValueError("Source page has no heading")
+        source_final_link = find_first(heading, "a")
+        if source_final_link is not None:
+            data["url"] = source_final_link.get('href')
+
+        # Get the description of the source (this is mostly present for USA sources)
+        pre_formatted_text = find_first(root, "pre")
+        if pre_formatted_text is not None:
+            data["description"] = element_text(pre_formatted_text).strip()
+
+        # Get social details
+        if root.xpath("//comment()[contains(., $marker)]", marker=SOCIAL_ENTRY_POINT):
+            data["social_media"] = []
+            social_tags_container = element_after_comment(root, SOCIAL_ENTRY_POINT)
+            if social_tags_container is not None:
+                for social_tag in social_tags_container.iterdescendants("a"):
+                    if social_tag.get("target") != "_blank":
+                        continue
+                    data["social_media"].append(extract_social_media_tag_info(social_tag))
+        return data
+
+    @staticmethod
+    def _section(text: str, entry_point: str):
+        # Parse from the marker comment if we can, falling back to the whole page
+        # in case the marker text also turns up outside a comment
+        section = element_after_comment(parse_html(text, start_marker=entry_point), entry_point)
+        if section is None:
+            section = element_after_comment(parse_html(text), entry_point)
+        return section
+
+
+PAGE_PARSERS = {
+    "lxml": LxmlPageParser,
+    "bs4": SoupPageParser,
+}
@@ -2,12 +2,13 @@ import json
 import logging
 import os
 from time import sleep
-import re
+from datetime import datetime, timezone
 from urllib.parse import urljoin
-from bs4 import BeautifulSoup, Comment
 
 from utils.scraper import BaseScraper
 from utils.database import SQLiteMixin
+from utils.page_cache import PageCache
+from thepaperboy_pages import PAGE_PARSERS, extract_location_totals, extract_social_media_tag_info
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO,
@@ -22,6 +23,8 @@ URLs = {
 
 DATABASE_PATH = "output/database/thepaperboy.db"
 JSON_DUMP_PATH = "output/files"
+# Number of crawled sources to record per database write
+STATUS_BATCH_SIZE = 20
 
 class ThePaperBoyScraper(SQLiteMixin, BaseScraper):
     def __init__(self):
@@ -29,6 +32,7 @@ class ThePaperBoyScraper(SQLiteMixin, BaseScraper):
         self.db = None
         self.base_url: str = URLs.get("BASE_URL")
         self.DATABASE_PATH = DATABASE_PATH
+        self.page_parser = PAGE_PARSERS["lxml"]()
         self.initialize_database()
         logger.info("Scraper is initialized with base URL %s", self.base_url)
 
@@ -59,57 +63,47 @@ class ThePaperBoyScraper(SQLiteMixin, BaseScraper):
             'id': 'INTEGER PRIMARY KEY',
             'url': 'TEXT NOT NULL UNIQUE',
             'data': 'TEXT NOT NULL UNIQUE',
+            'country': 'TEXT DEFAULT NULL',
+            'state': 'TEXT DEFAULT NULL',
             'crawl_status': 'TEXT CHECK (crawl_status IN ("pending", "in_progress", "completed")) DEFAULT "pending"',
             'start_crawl_time': 'TIMESTAMP DEFAULT NULL',
             'finish_crawl_time': 'TIMESTAMP DEFAULT NULL'
         })
+        self.migrate_sources_table()
+        self.page_cache = PageCache(self)
+
+    def migrate_sources_table(self):
+        # Databases from before country/state were columns only have them inside the data JSON
+        added = self.add_columns('sources', {
+            'country': 'TEXT DEFAULT NULL',
+            'state': 'TEXT DEFAULT NULL'
+        })
+        if added:
+            with self.transaction() as conn:
+                conn.execute("UPDATE sources SET country = json_extract(data, '$.country'), "
+                             "state = json_extract(data, '$.state')")
+            logger.info("Migrated sources table, country and state are now columns")
+
+        self.create_index('sources_location_status', 'sources', ['country', 'state', 'crawl_status'])
+        self.create_index('sources_country_status', 'sources', ['country', 'crawl_status'])
+        self.create_index('sources_crawl_status', 'sources', ['crawl_status'])
 
     def __scrape_locations(self, level):
         if level == "states":
             url = URLs.get("US_STATES_LIST")
-            entry_point = "START MAIN LEFT COLUMN TABLE"
         else:
             url = URLs.get("COUNTRY_LIST")
-            entry_point = "START MAIN COLUMN TABLE"
 
         total_records = self.count(level)
 
         if total_records == 0:
-            data = []
-            response = self.scraper.get(urljoin(self.base_url, url))
-            soup = BeautifulSoup(response.text, features="lxml")
-            comments = soup.find_all(string=lambda node: isinstance(node, Comment))
-            for comment in comments:
-                if entry_point in comment:
-                    main_table = comment.find_next()
-                    tables = main_table.find_all("table")
-                    for table in tables:
-                        rows = table.find_all("tr")
-                        for row in rows:
-                            anchors = row.find_all("a")
-                            for anchor in anchors:
-                                href = anchor.get("href")
-                                text = anchor.get_text(strip=True)
-                                if text != "(FP)":
-                                    if level == "countries":
-                                        location, total = self.extract_location_totals(text, level)
-                                        if location and total:
-                                            logger.info("Found: href=%s, location=%s, total=%s",
-                                                        href, location, total)
-                                            data.append({
-                                                "name": location,
-                                                "url": href,
-                                                "total": total
-                                            })
-                                    elif level == "states":
-                                        location, abbreviation, total = self.extract_location_totals(text, level)
-                                        data.append({
-                                            "name": location,
-                                            "abbreviation": abbreviation,
-                                            "url": href,
-                                            "total": total
-                                        })
-                    break
+            url = urljoin(self.base_url, url)
+            response = self.require_ok(self.get_page(url))
+            data = self.parse_page(url, response, lambda text: self.page_parser.parse_locations(text, level))
+            if level == "countries":
+                for location in data:
+                    logger.info("Found: href=%s, location=%s, total=%s",
+                                location["url"], location["name"], location["total"])
             logger.info("Recording [%s] %s", len(data), level)
             self.bulk_insert(level, data, "IGNORE")
         else:
@@ -118,77 +112,26 @@ class ThePaperBoyScraper(SQLiteMixin, BaseScraper):
         return True
 
     def __scrape_sources_from_specific_location(self, data):
-        response = self.scraper.get(urljoin(self.base_url, data.get("url")))
-        fetched_data = []
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, features="lxml")
-            comments = soup.find_all(string=lambda text: isinstance(text, Comment))
-            for comment in comments:
-                if "START MAIN PAPER DISPLAY TABLE" in comment:
-                    main_table = comment.find_next()
-                    if data.get("country") == "United States":
-                        no_columns = 3
-                    else:
-                        no_columns = 4
-                    rows = main_table.find_all("tr")[1:]
-                    for index, row in enumerate(rows, start=1):
-                        cells = row.find_all("td")
-                        if len(cells) == no_columns:
-                            source_link_tag = cells[0].find("a")
-                            name = source_link_tag.get_text(strip=True)
-                            url = source_link_tag['href']
-
-                            # Local sources (USA) have 3 columns, other sources have 4 columns
-                            if no_columns == 4:
-                                city = cells[1].find("a", href=True).get_text()
-                                state = cells[2].find("a", href=True).get_text()
-                                language = cells[3].find("font", class_="smallfont").get_text()
-                                country = data.get("name")
-                            else:
-                                state = data.get("name")
-                                city = cells[1].find("a", href=True).get_text()
-                                language = cells[2].find("font", class_="smallfont").get_text()
-                                country = data.get("country")
-
-                            fetched_data.append({"url": url, "data": json.dumps({
-                                "state": state,
-                                "country": country,
-                                "url": url,
-                                "city": city,
-                                "language": language,
-                                "name": name
-                            })})
-
-            logger.info("Recording [%s] sources", len(fetched_data))
-            self.bulk_insert("sources", fetched_data, "IGNORE")
-            return fetched_data
+        url = urljoin(self.base_url, data.get("url"))
+        response = self.require_ok(self.get_page(url))
+        fetched_data = self.parse_page(url, response,
+                                       lambda text: self.page_parser.parse_location_sources(text, data))
+        logger.info("Recording [%s] sources", len(fetched_data))
+        self.bulk_insert("sources", fetched_data, "IGNORE")
+        return fetched_data
 
     def __scrape_source_metadata(self, data):
         if data.get("url"):
-            response = self.scraper.get(urljoin(self.base_url, data.get("url")))
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, features="lxml")
-                # Get the link to the actual source website
-                source_final_link = soup.find("h1").find("a")
-                if source_final_link:
-                    data["url"] = source_final_link.get('href')
-
-                # Get the description of the source (this is mostly present for USA sources)
-                pre_formatted_text = soup.find("pre")
-                if pre_formatted_text:
-                    data["description"] = pre_formatted_text.text.strip()
-
-                # Get social details
-                comments = soup.find_all(string=lambda text: isinstance(text, Comment))
-                for comment in comments:
-                    if "SHOW SOCIAL ICONS AVAILABLE" in comment:
-                        data["social_media"] = []
-                        social_tags_container = comment.find_next()
-                        if social_tags_container:
-                            social_tags = social_tags_container.find_all('a', target="_blank")
-                            for social_tag in social_tags:
-                                data["social_media"].append(self.extract_social_media_tag_info(social_tag))
-                        break
+            url = urljoin(self.base_url, data.get("url"))
+            self.__parse_source_metadata(data, self.get_page(url), url)
+        return data
+
+    def __parse_source_metadata(self, data, response, url):
+        # Anything but a 200 or 304 (e.g. a 403 block) raises, so the source isn't marked completed without metadata
+        self.require_ok(response)
+        # Parsed into a fresh dict, so the page cache holds only what came from the page
+        data.update(self.parse_page(url, response,
+                                    lambda text: self.page_parser.parse_source_metadata(text, {})))
         return data
 
     def scrape_us_sources(self):
@@ -241,33 +184,61 @@ class ThePaperBoyScraper(SQLiteMixin, BaseScraper):
                                     where="name <> ?",
                                     params=("United States",)
                                     )
-        updated_data = None
+        # Shared by every location, so the host's rate limit carries over from one location to the next
+        if self.async_fetch:
+            scheduler = self.async_fetcher()
+        else:
+            scheduler = self.crawl_scheduler()
+        source_url = lambda source: urljoin(self.base_url, source.get("url"))
         if len(locations) > 0:
             for location in locations:
                 logger.info("Scraping sources from %s",location.get("name"))
-                sources = self.select("sources", where="data LIKE ? AND finish_crawl_time IS NULL",
-                                      params = (f"%{location.get('name')}%",))
-                for source in sources:
-                    data = json.loads(source.get("data"))
-                    self.update("sources", {"start_crawl_time": "CURRENT_TIMESTAMP",
-                                            "crawl_status": "in_progress"}, "id = ?",
-                                (source.get("id"),))
-                    updated_data = self.scrape_source_metadata_with_retry(data)
+                if location_type == "local":
+                    where = "country = ? AND state = ? AND crawl_status IN ('pending', 'in_progress')"
+                    params = ("United States", location.get("name"))
+                else:
+                    where = "country = ? AND crawl_status IN ('pending', 'in_progress')"
+                    params = (location.get("name"),)
+                sources = self.iter_select("sources", where=where, params=params)
+                # Completed sources are written in batches rather than with two updates each
+                completed = []
+                found_sources = False
+                if self.async_fetch:
+                    crawled = scheduler.run(sources, source_url, self.parse_pending_source)
+                else:
+                    crawled = scheduler.run(sources, self.scrape_pending_source, source_url)
+                failed = False
+                for source, result, error in crawled:
+                    found_sources = True
+                    if error or result is None:
+                        # None when the async fetcher gave up on the page
+                        data, start_crawl_time, updated_data = json.loads(source.get("data")), None, None
+                    else:
+                        data, start_crawl_time, updated_data = result
                     if updated_data:
                         logger.info("Recorded metadata for %s", data.get("name"))
-                        self.update("sources", {"finish_crawl_time": "CURRENT_TIMESTAMP",
-                                                "crawl_status": "completed", "data": json.dumps(updated_data)}, "id = ?",
-                                    (source.get("id"),))
+                        completed.append({"id": source.get("id"),
+                                          "start_crawl_time": start_crawl_time,
+                                          "finish_crawl_time": self.current_timestamp(),
+                                          "crawl_status": "completed",
+                                          "data": json.dumps(updated_data)})
+                        if len(completed) >= STATUS_BATCH_SIZE:
+                            self.bulk_update("sources", completed)
+                            completed = []
                     else:
+                        # The source stays pending for the next run. A host that keeps failing is paused
+                        # by the circuit breaker, so only give up once the run's retry budget is spent or we're blocked
                         logger.error("Unable to fetch metadata for %s", data.get("name"))
-                        break
+                        if self.retry_policy.exhausted():
+                            # Let the requests already in flight finish, but don't start any more
+                            failed = True
+                            scheduler.stop()
 
-                    logging.info("Crawl delay. Waiting for %s seconds...", self.crawl_delay)
-                    sleep(self.crawl_delay)
+                self.bulk_update("sources", completed)
 
-                if len(sources) > 0:
-                    if not updated_data:
-                        logging.error("Last fetch failed despite retrires, possible network problem exiting loop...")
+                if found_sources:
+                    if failed:
+                        logging.error("Retry budget spent or requests blocked, exiting loop...")
                         break
                 else:
                     logging.info("No pending sources found...")
@@ -275,6 +246,19 @@ class ThePaperBoyScraper(SQLiteMixin, BaseScraper):
         else:
             logger.info("No countries found, exiting...")
 
+    def scrape_pending_source(self, source):
+        # Runs on a crawl scheduler worker, the caller records the outcome
+        data = json.loads(source.get("data"))
+        start_crawl_time = self.current_timestamp()
+        return data, start_crawl_time, self.scrape_source_metadata_with_retry(data)
+
+    def parse_pending_source(self, source, response):
+        # The async counterpart of scrape_pending_source, called once the page has been fetched
+        data = json.loads(source.get("data"))
+        start_crawl_time = self.current_timestamp()
+        url = urljoin(self.base_url, source.get("url"))
+        return data, start_crawl_time, self.__parse_source_metadata(data, response, url)
+
     def scrape_source_metadata_with_retry(self, data):
         return self.scrape_content_with_retry(self.__scrape_source_metadata, data)
 
@@ -288,52 +272,46 @@ class ThePaperBoyScraper(SQLiteMixin, BaseScraper):
         return self.scrape_content_with_retry(self.__scrape_locations, "states")
 
     def export_sources_to_file(self):
-        sources = self.select("sources",
-                                where="crawl_status = ?",
-                                params=("completed",)
-                                )
-        data = []
-        for source in sources:
-            data.append(json.loads(source.get("data")))
+        sources = self.iter_select("sources",
+                                   columns=["data"],
+                                   where="crawl_status = ?",
+                                   params=("completed",)
+                                   )
 
         os.makedirs(JSON_DUMP_PATH, exist_ok=True)
 
-        # Write data to JSON file
+        # Write data to JSON file one source at a time, rather than building the whole list first
         with open(f"{JSON_DUMP_PATH}/the_paperboy_sources.json", "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
+            f.write("[")
+            for index, source in enumerate(sources):
+                if index > 0:
+                    f.write(", ")
+                json.dump(json.loads(source.get("data")), f, ensure_ascii=False)
+            f.write("]")
 
         logger.info("Data has been written to file")
 
     @staticmethod
-    def extract_location_totals(text: str, location_type: str):
-        if location_type == "countries":
-            pattern = r"(.*?)\s*\((\d+)\)"
-            match = re.search(pattern, text)
-            if match:
-                country = match.group(1).strip()
-                total = int(match.group(2))
-                return country, total
-        elif location_type == "states":
-            pattern = r"(.*?)\[(.*?)\]\((\d+)\)"
-            match = re.search(pattern, text)
-            if match:
-                state_name = match.group(1).strip()
-                state_abbrev = match.group(2)
-                total = int(match.group(3))
-                return state_name, state_abbrev, total
-        return None, None
-
-    @staticmethod
-    def extract_social_media_tag_info(social_media_anchor_tag):
-        social_media_info = {}
-        url = social_media_anchor_tag.get("href")
-        if "wikipedia" in url:
-            social_media_info["Wikipedia"] = url
-        elif "facebook" in url:
-            social_media_info["Facebook"] = url
-        elif "twitter" in url:
-            social_media_info["Twitter"] = url
-        return social_media_info
+    def current_timestamp():
+        # Same format as SQLite's CURRENT_TIMESTAMP, for values set from python
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    extract_location_totals = staticmethod(extract_location_totals)
+    extract_social_media_tag_info = staticmethod(extract_social_media_tag_info)
+
+    def define_options(self, ap):
+        super().define_options(ap)
+        ap.add_argument(
+            '--parser',
+            choices=sorted(PAGE_PARSERS),
+            dest="parser",
+            default="lxml",
+            help='HTML parser for the pages (default: lxml)'
+        )
+
+    def process_args(self) -> None:
+        super().process_args()
+        self.page_parser = PAGE_PARSERS[self.args.parser]()
 
     def main(self):
         super().main()
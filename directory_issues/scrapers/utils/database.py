@@ -2,7 +2,9 @@ import logging
 import os
 from pathlib import Path
 import sqlite3
-from typing import List, Dict, Any, Optional, Tuple, Union
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple, Union, Iterator
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO,
@@ -12,12 +14,27 @@ class SQLiteMixin:
     """
     A mixin class providing common SQLite database operations.
     Subclasses should set the DATABASE_PATH class attribute.
+
+    Each thread keeps one long-lived connection to DATABASE_PATH, opened in WAL mode.
+    Statements commit as they run unless they are inside a transaction() block,
+    in which case the whole block commits once at the end.
     """
     DATABASE_PATH: str = None
+    JOURNAL_MODE: str = "WAL"
+    SYNCHRONOUS: str = "NORMAL"
+
+    _local_lock = threading.Lock()
+
+    def _local(self) -> threading.local:
+        local = self.__dict__.get("_sqlite_local")
+        if local is None:
+            with SQLiteMixin._local_lock:
+                local = self.__dict__.setdefault("_sqlite_local", threading.local())
+        return local
 
     def _get_connection(self) -> sqlite3.Connection:
         """
-        Create and return a database connection.
+        Return this thread's database connection, opening it on first use.
 
         Returns:
             sqlite3.Connection: An active database connection
@@ -27,7 +44,14 @@ class SQLiteMixin:
         """
         if not self.DATABASE_PATH:
             raise ValueError("DATABASE_PATH must be set in the subclass")
-        
+
+        local = self._local()
+        conn = getattr(local, "conn", None)
+        if conn is not None and local.path == self.DATABASE_PATH:
+            return conn
+        if conn is not None:
+            conn.close()
+
         try:
             db_dir = os.path.dirname(self.DATABASE_PATH)
             if db_dir:
@@ -35,30 +59,74 @@ class SQLiteMixin:
                 logger.debug(f"Created database directory: {db_dir}")
 
             conn = sqlite3.connect(self.DATABASE_PATH)
+            conn.execute(f"PRAGMA journal_mode={self.JOURNAL_MODE}")
+            conn.execute(f"PRAGMA synchronous={self.SYNCHRONOUS}")
+            local.conn = conn
+            local.path = self.DATABASE_PATH
+            local.depth = 0
             logger.debug("Database connection established.")
             return conn
         except sqlite3.Error as e:
             logger.exception(f"Error connecting to the database: {e}")
             raise
 
+    def _in_transaction(self) -> bool:
+        return getattr(self._local(), "depth", 0) > 0
+
+    def _commit(self, conn: sqlite3.Connection) -> None:
+        # Statements inside a transaction() block are committed when the block exits
+        if not self._in_transaction():
+            conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group statements so they commit once, e.g. a batch of updates.
+        Rolls back everything in the block if it raises. Nested blocks join the outer one.
+
+            with self.transaction():
+                for row in rows:
+                    self.update(...)
+        """
+        conn = self._get_connection()
+        local = self._local()
+        local.depth += 1
+        try:
+            yield conn
+        except Exception:
+            local.depth -= 1
+            if local.depth == 0:
+                conn.rollback()
+            raise
+        else:
+            local.depth -= 1
+            if local.depth == 0:
+                conn.commit()
+
+    def close(self) -> None:
+        """
+        Close this thread's connection, it will be reopened on next use.
+        """
+        local = self._local()
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            conn.close()
+            local.conn = None
+
     def __execute_query(self, query: str, params: Optional[Tuple[Any, ...]] = None) -> sqlite3.Cursor:
         """
         Helper method to execute a query and return a cursor.
         """
-        conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute(query, params or ())
-            conn.commit()
+            self._commit(conn)
             logger.debug(f"Executed query: {query} | Params: {params}")
             return cursor
         except sqlite3.Error as e:
             logger.exception(f"Error executing query: {query} | Error: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
 
     def create_table(self, table_name: str, columns: Dict[str, str]) -> None:
         """
@@ -78,6 +146,41 @@ class SQLiteMixin:
         query = f"CREATE TABLE IF NOT EXISTS {table_name} ({column_definitions})"
         self.__execute_query(query)
 
+    def add_columns(self, table_name: str, columns: Dict[str, str]) -> List[str]:
+        """
+        Add any of the given columns which an existing table doesn't have yet,
+        for migrating databases created with an older schema.
+
+        Args:
+            table_name (str): Name of the table
+            columns (Dict[str, str]): Column definitions {column_name: column_type}
+
+        Returns:
+            List[str]: Names of the columns that were added
+        """
+        cursor = self.__execute_query(f"PRAGMA table_info({table_name})")
+        existing = {row[1] for row in cursor.fetchall()}
+
+        added = []
+        for col, dtype in columns.items():
+            if col not in existing:
+                self.__execute_query(f"ALTER TABLE {table_name} ADD COLUMN {col} {dtype}")
+                added.append(col)
+                logger.info(f"Added column {col} to {table_name}")
+        return added
+
+    def create_index(self, index_name: str, table_name: str, columns: List[str]) -> None:
+        """
+        Create an index on the given columns if it doesn't exist.
+
+        Args:
+            index_name (str): Name of the index
+            table_name (str): Name of the table
+            columns (List[str]): Columns to index, in order
+        """
+        query = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(columns)})"
+        self.__execute_query(query)
+
     def insert(self, table_name: str, data: Dict[str, Any]) -> int:
         """
         Insert a single record into the specified table.
@@ -124,13 +227,15 @@ class SQLiteMixin:
             for record in data:
                 values_list.append(tuple(record.values()))
 
-            with self._get_connection() as conn:
-                conn.executemany(query, values_list)
-                conn.commit()
-                logger.debug(f"Bulk inserted {len(data)} records into {table_name}.")
-                return True
+            conn = self._get_connection()
+            conn.executemany(query, values_list)
+            self._commit(conn)
+            logger.debug(f"Bulk inserted {len(data)} records into {table_name}.")
+            return True
         except sqlite3.Error as e:
             logger.exception(f"Error in bulk insert: {e}")
+            if not self._in_transaction():
+                self._get_connection().rollback()
             return False
 
     def select(self,
@@ -160,19 +265,69 @@ class SQLiteMixin:
         if where:
             query += f" WHERE {where}"
 
-        with self._get_connection() as conn:
+        cursor = self._get_connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        try:
+            cursor.execute(query, params or ())
+            rows = []
+            for row in cursor.fetchall():
+                rows.append(dict(row))
+            logger.debug(f"Selected {len(rows)} records from {table_name}.")
+            return rows
+        except sqlite3.Error as e:
+            logger.error(f"Error in select query: {e}")
+            raise
+
+    def iter_select(self,
+                    table_name: str,
+                    columns: Optional[List[str]] = None,
+                    where: Optional[str] = None,
+                    params: Optional[tuple] = None,
+                    order_by: Optional[str] = None,
+                    arraysize: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Stream records from the specified table, fetching arraysize rows at a time.
+
+        Rows are read on a separate connection, so the iteration sees a stable snapshot
+        even while the caller updates the same table (writes made inside an open
+        transaction() are not visible to it).
+
+        Args:
+            table_name (str): Name of the table
+            columns (Optional[List[str]]): Columns to retrieve (default: all)
+            where (Optional[str]): WHERE clause for filtering
+            params (Optional[tuple]): Parameters for the WHERE clause
+            order_by (Optional[str]): ORDER BY clause
+            arraysize (int): Number of rows fetched per round trip
+
+        Yields:
+            Dict[str, Any]: One record at a time
+        """
+        select_columns = ', '.join(columns) if columns else '*'
+        query = f"SELECT {select_columns} FROM {table_name}"
+        if where:
+            query += f" WHERE {where}"
+        if order_by:
+            query += f" ORDER BY {order_by}"
+
+        self._get_connection()  # Make sure the database and its directory exist
+        conn = sqlite3.connect(self.DATABASE_PATH)
+        try:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
-            try:
-                cursor.execute(query, params or ())
-                rows = []
-                for row in cursor.fetchall():
-                    rows.append(dict(row))
-                logger.debug(f"Selected {len(rows)} records from {table_name}.")
-                return rows
-            except sqlite3.Error as e:
-                logger.error(f"Error in select query: {e}")
-                raise
+            cursor.arraysize = arraysize
+            cursor.execute(query, params or ())
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        except sqlite3.Error as e:
+            logger.error(f"Error in iter_select query: {e}")
+            raise
+        finally:
+            conn.close()
 
     def count(self,
               table_name: str,
@@ -224,22 +379,21 @@ class SQLiteMixin:
         if group_by:
             query += f" GROUP BY {group_by}"
 
-        with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        cursor = self._get_connection().cursor()
+        cursor.row_factory = sqlite3.Row
 
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
 
-            if group_by:
-                result = []
-                for row in cursor.fetchall():
-                    result.append(dict(row))
-                return result
-            else:
-                return cursor.fetchone()['count']
+        if group_by:
+            result = []
+            for row in cursor.fetchall():
+                result.append(dict(row))
+            return result
+        else:
+            return cursor.fetchone()['count']
 
 
     def update(self,
@@ -276,6 +430,56 @@ class SQLiteMixin:
         cursor = self.__execute_query(query, update_params)
         return cursor.rowcount
 
+    def bulk_update(self,
+                    table_name: str,
+                    data: List[Dict[str, Any]],
+                    key_column: str = "id") -> int:
+        """
+        Update many records in one executemany call, matching each on key_column.
+        Every record must have the same keys; a column whose value in the first record
+        is "CURRENT_TIMESTAMP" is set to the current timestamp for all of them.
+
+        Args:
+            table_name (str): Name of the table
+            data (List[Dict[str, Any]]): Records holding key_column plus the columns to update
+            key_column (str): Column identifying the row to update (default: id)
+
+        Returns:
+            int: Number of rows affected
+        """
+        if not data:
+            return 0
+
+        set_clause_parts = []
+        value_columns = []
+        for key, value in data[0].items():
+            if key == key_column:
+                continue
+            if isinstance(value, str) and value.upper() == "CURRENT_TIMESTAMP":
+                set_clause_parts.append(f"{key} = CURRENT_TIMESTAMP")
+            else:
+                set_clause_parts.append(f"{key} = ?")
+                value_columns.append(key)
+
+        set_clause = ', '.join(set_clause_parts)
+        query = f"UPDATE {table_name} SET {set_clause} WHERE {key_column} = ?"
+
+        values_list = []
+        for record in data:
+            values_list.append(tuple(record[col] for col in value_columns) + (record[key_column],))
+
+        try:
+            conn = self._get_connection()
+            cursor = conn.executemany(query, values_list)
+            self._commit(conn)
+            logger.debug(f"Bulk updated {len(data)} records in {table_name}.")
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.exception(f"Error in bulk update: {e}")
+            if not self._in_transaction():
+                self._get_connection().rollback()
+            raise
+
     def delete(self, table_name: str, where: str, params: tuple) -> int:
         """
         Delete records from the specified table.
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from .database import SQLiteMixin
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format="%(asctime)s | %(name)s | %(levelname)s: %(message)s")
+
+NOT_MODIFIED = 304
+
+
+class PageCache:
+    """
+    Remembers, per URL, the validators (ETag / Last-Modified) and a hash of the body of the last
+    fetch, along with what the scraper parsed out of it. Kept in a table of the scraper's own database.
+
+    On a rerun requests are made conditional, so an unchanged page comes back as a bodiless 304;
+    for servers that don't send validators the body hash tells us the page is unchanged instead.
+    Either way the stored parse result is reused and the page isn't parsed again.
+    Page bodies aren't stored, so conditional headers are only sent once a parse result has been saved.
+    """
+    TABLE = "page_cache"
+
+    def __init__(self, store: SQLiteMixin):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.store.create_table(self.TABLE, {
+            'url': 'TEXT PRIMARY KEY',
+            'etag': 'TEXT DEFAULT NULL',
+            'last_modified': 'TEXT DEFAULT NULL',
+            'body_hash': 'TEXT DEFAULT NULL',
+            'parsed': 'TEXT DEFAULT NULL',
+            'fetched_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+        })
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        rows = self.store.select(self.TABLE, where="url = ?", params=(url,))
+        return rows[0] if rows else None
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        headers = {}
+        if entry is None or entry.get("parsed") is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    @staticmethod
+    def body_hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def cached_result(self, url: str, response) -> Optional[Any]:
+        """
+        The stored parse result for url if response shows the page is unchanged since it was saved, else None.
+        """
+        if response.status_code != NOT_MODIFIED and response.status_code != 200:
+            return None
+        entry = self.get(url)
+        if entry is None or entry.get("parsed") is None:
+            return None
+        if response.status_code == NOT_MODIFIED or entry.get("body_hash") == self.body_hash(response.content):
+            return json.loads(entry["parsed"])
+        return None
+
+    def record(self, url: str, response, parsed: Any) -> None:
+        self.store.bulk_insert(self.TABLE, [{
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body_hash": self.body_hash(response.content),
+            "parsed": json.dumps(parsed),
+        }], "REPLACE")
+
+    def clear(self) -> None:
+        self.store.delete(self.TABLE, "1 = 1", ())
@@ -0,0 +1,61 @@
+from typing import Optional
+
+from lxml import html as lxml_html
+from lxml.html import HtmlElement
+
+
+def parse_html(text: str, start_marker: Optional[str] = None) -> HtmlElement:
+    """
+    Parse a page with lxml. With start_marker, only the document from the comment containing
+    the marker onwards is parsed, which skips the (often much larger) header and navigation;
+    if the marker isn't found the whole page is parsed.
+    """
+    if start_marker:
+        position = text.find(start_marker)
+        if position != -1:
+            comment_start = text.rfind("<!--", 0, position)
+            if comment_start != -1:
+                # Open the body first, or a leading comment would end up outside <html>
+                # and the element after it would be <html> itself
+                text = "<html><body>" + text[comment_start:]
+    return lxml_html.document_fromstring(text)
+
+
+def element_after_comment(root: HtmlElement, marker: str) -> Optional[HtmlElement]:
+    """
+    The first element after the first comment containing marker, like BeautifulSoup's comment.find_next().
+    """
+    elements = root.xpath("(//comment()[contains(., $marker)])[1]/following::*[1]", marker=marker)
+    return elements[0] if elements else None
+
+
+def element_text(element: HtmlElement, strip: bool = False) -> str:
+    """
+    The text of element and its descendants, matching BeautifulSoup's get_text():
+    with strip, each piece of text is stripped and empty pieces are dropped.
+    """
+    pieces = element.itertext()
+    if strip:
+        return "".join(piece.strip() for piece in pieces if piece.strip())
+    return "".join(pieces)
+
+
+def find_first(element: HtmlElement, tag: str, **attributes) -> Optional[HtmlElement]:
+    """
+    The first descendant with the given tag, like BeautifulSoup's find(). Each keyword must match an attribute:
+    True means the attribute is present, class_ matches one of the element's classes, anything else must be equal.
+    Walking the tree is much cheaper than compiling an XPath for each lookup on a page with hundreds of rows.
+    """
+    for candidate in element.iterdescendants(tag):
+        if all(_attribute_matches(candidate, name, value) for name, value in attributes.items()):
+            return candidate
+    return None
+
+
+def _attribute_matches(element: HtmlElement, name: str, value) -> bool:
+    if name == "class_":
+        return value in element.get("class", "").split()
+    if value is True:
+        return element.get(name) is not None
+    return element.get(name) == value
+
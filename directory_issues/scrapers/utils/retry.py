@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Generator, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format="%(asctime)s | %(name)s | %(levelname)s: %(message)s")
+
+# Responses worth another attempt, everything else is treated as final
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Responses which hold the page, or tell us the copy we parsed last time is still current
+OK_STATUSES = (200, 304)
+# Responses which mean the site is refusing us, rather than that the page is missing
+BLOCK_STATUSES = (401, 403)
+
+# Yielded by RetryPolicy._steps when it wants the caller to make an attempt
+_ATTEMPT = object()
+
+
+class RetryableHTTPError(Exception):
+    """
+    Raised for a response whose status means the request may succeed later (e.g. 429 or 503).
+    Carries the server's Retry-After, in seconds, when it sent one.
+    """
+
+    def __init__(self, status_code: int, url: str = None, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status_code} from {url}")
+        self.status_code = status_code
+        self.url = url
+        self.retry_after = retry_after
+
+
+class HTTPStatusError(Exception):
+    """
+    Raised for a response whose status means retrying won't get us the page (e.g. a 403 block or a 404).
+    """
+
+    def __init__(self, status_code: int, url: str = None):
+        super().__init__(f"HTTP {status_code} from {url}")
+        self.status_code = status_code
+        self.url = url
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header, which is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def check_response(response, retry_statuses: Tuple[int, ...] = RETRY_STATUSES):
+    """
+    Raise RetryableHTTPError if the response has a retryable status, otherwise return it unchanged.
+    """
+    if response.status_code in retry_statuses:
+        raise RetryableHTTPError(response.status_code,
+                                 getattr(response, "url", None),
+                                 parse_retry_after(response.headers.get("Retry-After")))
+    return response
+
+
+def require_ok(response, ok_statuses: Tuple[int, ...] = OK_STATUSES):
+    """
+    check_response, then raise HTTPStatusError for any other status which doesn't hold the page.
+    """
+    response = check_response(response)
+    if response.status_code not in ok_statuses:
+        raise HTTPStatusError(response.status_code, getattr(response, "url", None))
+    return response
+
+
+def host_for(url: str) -> str:
+    return urlparse(url).netloc or url
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: attempt n waits a random time between 0 and
+    min(max_delay, base_delay * 2 ** n), so workers that failed together don't retry in lockstep.
+    A server's Retry-After overrides the computed delay (up to max_retry_after).
+
+    retry_budget caps the total number of retries in a run, shared by every worker; once it is spent
+    no more retries are made and exhausted() is True, which callers treat as "the site is blocking us".
+    Blocks (a 401 or 403) aren't retried, so they don't touch the budget; instead max_blocked of them
+    in a row, with no successful request in between, also make exhausted() True.
+    """
+
+    def __init__(self,
+                 max_retries: int = 3,
+                 base_delay: float = 1,
+                 max_delay: float = 60,
+                 max_retry_after: float = 600,
+                 retry_budget: Optional[int] = None,
+                 max_blocked: Optional[int] = 5):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_budget = retry_budget
+        self.max_blocked = max_blocked
+        self.retries = 0
+        self.blocked = 0
+        self.lock = threading.Lock()
+
+    def delay_for(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """
+        Seconds to wait before retry number attempt (starting at 1) after error.
+        """
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def take_retry(self) -> bool:
+        """
+        Spend one retry from the budget, returning False if there are none left.
+        """
+        with self.lock:
+            if self.retry_budget is not None and self.retries >= self.retry_budget:
+                return False
+            self.retries += 1
+            return True
+
+    def record_outcome(self, error: Optional[Exception]) -> None:
+        """
+        Count a block towards max_blocked, or reset the count after any other outcome.
+        """
+        with self.lock:
+            if getattr(error, "status_code", None) in BLOCK_STATUSES:
+                self.blocked += 1
+            else:
+                self.blocked = 0
+
+    def exhausted(self) -> bool:
+        with self.lock:
+            return ((self.retry_budget is not None and self.retries >= self.retry_budget)
+                    or (self.max_blocked is not None and self.blocked >= self.max_blocked))
+
+    def _steps(self, host: str, circuit_breaker: "CircuitBreaker",
+               label: str) -> Generator[Any, Optional[Tuple[Any, Optional[Exception]]], Any]:
+        """
+        The retry loop shared by call and call_async, with the waiting and the attempts left to them.
+        Yields a number of seconds to sleep, or _ATTEMPT to be sent back the (result, error) of an attempt,
+        and returns the result, or None if retries fail.
+
+        An exception, a retryable status or a falsy result counts as a failure, and this policy and
+        circuit_breaker decide the wait. An HTTPStatusError (e.g. a 403 or 404) fails straight away.
+        """
+        attempt = 0
+        while True:
+            pause = circuit_breaker.remaining_pause(host)
+            if pause > 0:
+                logger.warning("Requests to %s are paused, waiting %.1f seconds...", host, pause)
+                yield pause
+
+            result, error = yield _ATTEMPT
+            # Retryable failures neither count as a block nor show the site has stopped blocking us
+            if isinstance(error, HTTPStatusError) or (error is None and result):
+                self.record_outcome(error)
+            if error is None and result:
+                circuit_breaker.record_success(host)
+                return result
+            circuit_breaker.record_failure(host)
+            if isinstance(error, HTTPStatusError):
+                logger.warning("Not retrying %s: %s", label, error)
+                return None
+            if error is not None:
+                logger.info("Error fetching %s: %s", label, error)
+
+            attempt += 1
+            if attempt >= self.max_retries:
+                break
+            if not self.take_retry():
+                logger.error("Retry budget of %s spent.", self.retry_budget)
+                break
+            delay = self.delay_for(attempt, error)
+            logger.info("Retry [%s/%s] for %s. Waiting %.1f seconds...", attempt, self.max_retries, label, delay)
+            yield delay
+        logger.error("Retries exhausted. Fetching %s failed.", label)
+        return None
+
+    def call(self, attempt: Callable[[], Any], host: str, circuit_breaker: "CircuitBreaker",
+             label: Optional[str] = None) -> Any:
+        """
+        attempt(), retried as this policy allows. Returns its result, or None if retries fail.
+        """
+        steps = self._steps(host, circuit_breaker, label or host)
+        outcome = None
+        try:
+            while True:
+                step = steps.send(outcome)
+                outcome = None
+                if step is _ATTEMPT:
+                    try:
+                        outcome = attempt(), None
+                    except Exception as e:
+                        outcome = None, e
+                else:
+                    time.sleep(step)
+        except StopIteration as done:
+            return done.value
+
+    async def call_async(self, attempt: Callable[[], Awaitable[Any]], host: str, circuit_breaker: "CircuitBreaker",
+                         label: Optional[str] = None) -> Any:
+        """
+        The same as call, awaiting attempt() and sleeping without blocking the event loop.
+        """
+        steps = self._steps(host, circuit_breaker, label or host)
+        outcome = None
+        try:
+            while True:
+                step = steps.send(outcome)
+                outcome = None
+                if step is _ATTEMPT:
+                    try:
+                        outcome = await attempt(), None
+                    except Exception as e:
+                        outcome = None, e
+                else:
+                    await asyncio.sleep(step)
+        except StopIteration as done:
+            return done.value
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures per host. After failure_threshold of them the host is paused
+    for reset_timeout seconds; the first request after the pause is a trial, and another failure
+    pauses the host again straight away.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 300):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures: Dict[str, int] = {}
+        self.paused_until: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def remaining_pause(self, host: str) -> float:
+        """
+        Seconds until requests to host may resume, 0 if it isn't paused.
+        """
+        with self.lock:
+            return max(0.0, self.paused_until.get(host, 0) - time.monotonic())
+
+    def wait(self, host: str) -> None:
+        pause = self.remaining_pause(host)
+        if pause > 0:
+            logger.warning("Requests to %s are paused, waiting %.1f seconds...", host, pause)
+            time.sleep(pause)
+
+    def record_success(self, host: str) -> None:
+        with self.lock:
+            self.failures[host] = 0
+
+    def record_failure(self, host: str) -> None:
+        with self.lock:
+            failures = self.failures.get(host, 0) + 1
+            self.failures[host] = failures
+            if failures >= self.failure_threshold:
+                self.paused_until[host] = time.monotonic() + self.reset_timeout
+                # One failure is enough to pause it again after the trial request
+                self.failures[host] = self.failure_threshold - 1
+                logger.warning("%s failed %s times in a row, pausing requests for %s seconds",
+                               host, failures, self.reset_timeout)
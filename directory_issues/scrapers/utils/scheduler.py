@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO,
+                    format="%(asctime)s | %(name)s | %(levelname)s: %(message)s")
+
+
+# Returned for work that was dropped because the scheduler was stopped before it started
+_SKIPPED = object()
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket: tokens refill at `rate` per second up to `capacity`,
+    and each request takes one, waiting until one is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Take a token, blocking until one is available.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class HostTokenBuckets:
+    """
+    One TokenBucket per host, so each host is held to the configured rate independently.
+
+    Unlike directory_issues.concurrency.HostRateLimiter, which strictly spaces out API calls,
+    a bucket lets `burst` requests through at once. The scrapers run as standalone scripts,
+    so they can't share that package's implementation anyway.
+    """
+
+    def __init__(self, requests_per_second: float, burst: float = 1):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def bucket_for(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc or url
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.requests_per_second, self.burst)
+            return self.buckets[host]
+
+    def acquire(self, url: str) -> None:
+        self.bucket_for(url).acquire()
+
+
+class CrawlScheduler:
+    """
+    Runs crawl work on a bounded pool of workers while holding every host to a polite rate.
+
+    Work items are pulled lazily from an iterable (e.g. SQLiteMixin.iter_select over the rows
+    still pending in a crawl_status table), so at most max_pending items are in memory at once.
+    Results come back in completion order, on the calling thread, which is where they should be
+    written to the database.
+    """
+
+    def __init__(self,
+                 max_workers: int = 4,
+                 requests_per_second: Optional[float] = 1.0,
+                 burst: float = 1,
+                 max_pending: Optional[int] = None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max_workers * 2
+        # None leaves the rate to the work itself, e.g. a scraper's get_page
+        self.rate_limiter = HostTokenBuckets(requests_per_second, burst) if requests_per_second else None
+        self.stopped = threading.Event()
+
+    def stop(self) -> None:
+        """
+        Stop handing out new work. Requests already in flight still complete and are yielded.
+        """
+        self.stopped.set()
+
+    def _run_one(self, work: Callable[[Any], Any], url: str, item: Any) -> Any:
+        if self.stopped.is_set():
+            return _SKIPPED
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        if self.stopped.is_set():
+            return _SKIPPED
+        return work(item)
+
+    def run(self,
+            items: Iterable[Any],
+            work: Callable[[Any], Any],
+            url_for: Callable[[Any], str]) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """
+        Apply work to every item, waiting on the rate limit for url_for(item)'s host first.
+
+        Args:
+            items (Iterable[Any]): Work items, consumed lazily
+            work (Callable[[Any], Any]): Called on a worker thread with each item
+            url_for (Callable[[Any], str]): The URL an item will fetch, used for per-host limits
+
+        Yields:
+            Tuple[Any, Any, Optional[Exception]]: (item, result, error) as each item finishes
+        """
+        self.stopped.clear()
+        items = iter(items)
+        pending = {}
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                while not exhausted and not self.stopped.is_set() and len(pending) < self.max_pending:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    future = executor.submit(self._run_one, work, url_for(item), item)
+                    pending[future] = item
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    try:
+                        result, error = future.result(), None
+                    except Exception as e:
+                        logger.exception(f"Error crawling {url_for(item)}: {e}")
+                        result, error = None, e
+                    if result is _SKIPPED:
+                        continue
+                    yield item, result, error
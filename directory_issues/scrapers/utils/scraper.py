@@ -1,47 +1,213 @@
 import argparse
+import asyncio
 import logging
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
 import cloudscraper
 from cloudscraper import CloudScraper
 
+from .page_cache import PageCache
+from .retry import CircuitBreaker, RetryPolicy, check_response, host_for, require_ok
+from .scheduler import CrawlScheduler, HostTokenBuckets
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s | %(name)s | %(levelname)s: %(message)s")
 
+
+def resize_pools(session, max_connections: int) -> None:
+    """
+    Let each of the session's adapters hold at least max_connections keep-alive connections per host.
+    The adapters are resized in place rather than replaced: cloudscraper's https adapter carries the
+    TLS cipher suite and ECDH curve that get us past the bot protection, and a plain HTTPAdapter would lose them.
+    Resizing rebuilds an adapter's pool manager, dropping its open connections, so it is only done when needed.
+    """
+    for adapter in session.adapters.values():
+        if getattr(adapter, "_pool_maxsize", 0) >= max_connections:
+            continue
+        adapter.poolmanager.clear()
+        # CipherSuiteAdapter.init_poolmanager passes its ssl_context on to the new pool manager
+        adapter.init_poolmanager(max_connections, max_connections, block=getattr(adapter, "_pool_block", False))
+
+
+class AsyncFetcher:
+    """
+    Fetches pages from an asyncio event loop so many requests can be waiting on the network at once.
+
+    The requests themselves still go through the scraper's (cloudscraper) session, which is what gets
+    us past the sites' bot protection, so each one runs on a bounded pool of threads sharing the session's
+    keep-alive connections (see resize_pools). Retries go through the same RetryPolicy loop as
+    scrape_content_with_retry, so a falsy parse result counts as a failure and an HTTPStatusError isn't retried.
+    Rate limits are left to get, e.g. a scraper's get_page.
+    """
+
+    def __init__(self,
+                 session,
+                 max_connections: int = 10,
+                 timeout: float = 30,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 get: Optional[Callable] = None):
+        self.session = session
+        # What makes each request, session.get unless e.g. conditional requests are wanted
+        self.get = get or session.get
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.stopped = False
+
+        resize_pools(self.session, max_connections)
+
+    def stop(self) -> None:
+        """
+        Stop starting new chunks of work. The chunk in flight still completes and is yielded.
+        """
+        self.stopped = True
+
+    def _get(self, url: str, **kwargs):
+        # Runs on an executor thread, so waiting on a rate limit in get doesn't block the event loop
+        return self.get(url, timeout=self.timeout, **kwargs)
+
+    async def fetch(self, url: str, **kwargs):
+        """
+        Fetch a single page, returning the response.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            return await loop.run_in_executor(self._executor, partial(self._get, url, **kwargs))
+
+    async def fetch_with_retry(self, url: str, parse: Callable[[Any], Any], **kwargs) -> Any:
+        """
+        Fetch url and parse the response, retrying on errors and empty results.
+
+        Returns:
+            Any: The parsed result, or None if retries fail.
+        """
+        async def attempt():
+            return parse(check_response(await self.fetch(url, **kwargs)))
+
+        return await self.retry_policy.call_async(attempt, host_for(url), self.circuit_breaker, label=url)
+
+    async def _fetch_chunk(self, chunk, url_for, parse):
+        return await asyncio.gather(*[
+            self.fetch_with_retry(url_for(item), partial(parse, item)) for item in chunk
+        ], return_exceptions=True)
+
+    def run(self,
+            items: Iterable[Any],
+            url_for: Callable[[Any], str],
+            parse: Callable[[Any, Any], Any],
+            chunk_size: Optional[int] = None) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """
+        Fetch url_for(item) for every item and call parse(item, response) on the result,
+        with up to max_connections requests in flight. Items are consumed lazily, chunk_size at a time.
+
+        Yields:
+            Tuple[Any, Any, Optional[Exception]]: (item, result, error) for each item, in input order
+        """
+        chunk_size = chunk_size or self.max_connections * 2
+        self.stopped = False
+        items = iter(items)
+
+        loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_connections)
+        self._semaphore = asyncio.Semaphore(self.max_connections)
+        try:
+            while not self.stopped:
+                chunk = [item for _, item in zip(range(chunk_size), items)]
+                if not chunk:
+                    break
+                results = loop.run_until_complete(self._fetch_chunk(chunk, url_for, parse))
+                for item, result in zip(chunk, results):
+                    if isinstance(result, Exception):
+                        yield item, None, result
+                    else:
+                        yield item, result, None
+        finally:
+            self._executor.shutdown(wait=True)
+            loop.close()
+
+
 class BaseScraper:
     def __init__(self):
         self.args = None
         self.data_to_scrape = ""
         self.max_retries = 3
         self.crawl_delay = 10
+        self.max_workers = 1
+        self.requests_per_second = None
+        self.async_fetch = False
+        self.request_timeout = 30
+        self.retry_policy = RetryPolicy(max_retries=self.max_retries, base_delay=self.crawl_delay)
+        self.circuit_breaker = CircuitBreaker()
+        # Set by scrapers with a database to keep it in, see PageCache
+        self.page_cache: Optional[PageCache] = None
+        # Taken by get_page for every request, retries included. Set from the crawl rate by process_args
+        self.rate_limiter: Optional[HostTokenBuckets] = None
+        self._async_fetcher: Optional[AsyncFetcher] = None
         self.scraper: CloudScraper = cloudscraper.create_scraper(browser={"browser": "chrome", "platform": "windows"})
 
-    def scrape_content_with_retry(self, method, *args, **kwargs):
+    def scrape_content_with_retry(self, method, *args, host=None, **kwargs):
         """
         A method to for scraping content with exponential backoff.
+        Waits follow self.retry_policy (jittered, or the server's Retry-After when a
+        RetryableHTTPError carries one), and a host the circuit breaker has paused is waited out first.
+        An HTTPStatusError isn't retried.
 
         Args:
             method (callable): The method to execute.
             *args: Positional arguments for the method.
+            host (str): The host the method requests, for the circuit breaker (default: base_url's host)
             **kwargs: Keyword arguments for the method.
 
         Returns:
             Any: The return value of the method, or None if retries fail.
         """
-        number_of_retries = 0
-        while number_of_retries < self.max_retries:
-            try:
-                result = method(*args, **kwargs)
-                if result:
-                    return result
-            except Exception as e:
-                logging.info(f"Error during execution: {e}")
-            number_of_retries += 1
-            delay = self.crawl_delay * number_of_retries
-            logging.info("Retry [%s/%s]. Waiting %s seconds...", number_of_retries, self.crawl_delay, delay)
-            sleep(delay)
-        logging.error("Max retries reached. Method execution failed.")
-        return None
+        host = host or host_for(getattr(self, "base_url", None) or method.__name__)
+        return self.retry_policy.call(lambda: method(*args, **kwargs), host, self.circuit_breaker,
+                                      label=args[0] if args and isinstance(args[0], str) else method.__name__)
+
+    def get_page(self, url: str, **kwargs):
+        """
+        GET url through the scraper session, conditionally if the page cache has a parse result for it.
+        Waits for the host's rate limit first.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        if self.page_cache is not None:
+            headers = {**PageCache.conditional_headers(self.page_cache.get(url)), **kwargs.pop("headers", {})}
+            if headers:
+                kwargs["headers"] = headers
+        return self.scraper.get(url, **kwargs)
+
+    def parse_page(self, url: str, response, parse: Callable[[str], Any]) -> Any:
+        """
+        parse(response.text), or the result saved when url was last parsed if the page hasn't changed since.
+        Results must be JSON serializable to be cached.
+        """
+        if self.page_cache is None:
+            return parse(response.text)
+        cached = self.page_cache.cached_result(url, response)
+        if cached is not None:
+            self.page_cache.hits += 1
+            logger.info("%s is unchanged, reusing its last parse", url)
+            return cached
+        self.page_cache.misses += 1
+        result = parse(response.text)
+        self.page_cache.record(url, response, result)
+        return result
+
+    @staticmethod
+    def check_response(response):
+        # Raises RetryableHTTPError for 429/5xx so the retry policy can see the status and Retry-After
+        return check_response(response)
+
+    @staticmethod
+    def require_ok(response):
+        # check_response, and raises HTTPStatusError for anything else but a 200 or 304
+        return require_ok(response)
 
     def define_options(self, ap):
         ap.add_argument(
@@ -58,6 +224,74 @@ class BaseScraper:
             default=1,
             help='Delay in seconds between retries (default: 10)'
         )
+        ap.add_argument(
+            '--retry-budget',
+            type=int,
+            dest="retry_budget",
+            default=100,
+            help='Maximum number of retries in the whole run (default: 100)'
+        )
+        ap.add_argument(
+            '--max-blocked',
+            type=int,
+            dest="max_blocked",
+            default=5,
+            help='Consecutive 401/403 responses after which the run stops as blocked (default: 5)'
+        )
+        ap.add_argument(
+            '--max-retry-delay',
+            type=float,
+            dest="max_retry_delay",
+            default=300,
+            help='Longest backoff between retries, in seconds (default: 300)'
+        )
+        ap.add_argument(
+            '--failure-threshold',
+            type=int,
+            dest="failure_threshold",
+            default=5,
+            help='Consecutive failures before requests to a host are paused (default: 5)'
+        )
+        ap.add_argument(
+            '--host-pause',
+            type=float,
+            dest="host_pause",
+            default=300,
+            help='Seconds to pause a failing host for (default: 300)'
+        )
+        ap.add_argument(
+            '--max-workers',
+            type=int,
+            dest="max_workers",
+            default=1,
+            help='Number of pages fetched concurrently (default: 1)'
+        )
+        ap.add_argument(
+            '--requests-per-second',
+            type=float,
+            dest="requests_per_second",
+            default=None,
+            help='Maximum requests per second to any one host (default: one per crawl delay)'
+        )
+        ap.add_argument(
+            '--async-fetch',
+            action='store_true',
+            dest="async_fetch",
+            help='Fetch pages from an asyncio event loop, with --max-workers connections'
+        )
+        ap.add_argument(
+            '--request-timeout',
+            type=float,
+            dest="request_timeout",
+            default=30,
+            help='Timeout in seconds for each request (default: 30)'
+        )
+        ap.add_argument(
+            '--no-page-cache',
+            action='store_true',
+            dest="no_page_cache",
+            help='Fetch and parse every page again, ignoring the page cache'
+        )
         ap.add_argument(
             '--data',
             type=str,
@@ -70,8 +304,46 @@ class BaseScraper:
         args = self.args
         self.crawl_delay = args.crawl_delay
         self.max_retries = args.max_retries
+        self.max_workers = args.max_workers
+        self.requests_per_second = args.requests_per_second
+        self.async_fetch = args.async_fetch
+        self.request_timeout = args.request_timeout
+        self.retry_policy = RetryPolicy(max_retries=self.max_retries,
+                                        base_delay=self.crawl_delay,
+                                        max_delay=args.max_retry_delay,
+                                        retry_budget=args.retry_budget,
+                                        max_blocked=args.max_blocked)
+        self.circuit_breaker = CircuitBreaker(failure_threshold=args.failure_threshold,
+                                              reset_timeout=args.host_pause)
+        self.rate_limiter = HostTokenBuckets(self.crawl_rate())
+        if args.no_page_cache:
+            self.page_cache = None
         self.data_to_scrape = args.data
 
+    def crawl_rate(self) -> float:
+        """
+        Requests per second allowed to each host. Without an explicit rate, each host
+        gets one request per crawl_delay, the same spacing as the sequential crawl.
+        """
+        if self.requests_per_second:
+            return self.requests_per_second
+        return 1 / self.crawl_delay if self.crawl_delay else 100
+
+    def crawl_scheduler(self) -> CrawlScheduler:
+        # No limit in the scheduler itself, get_page holds each request (retries included) to the crawl rate
+        return CrawlScheduler(max_workers=self.max_workers, requests_per_second=None)
+
+    def async_fetcher(self) -> AsyncFetcher:
+        # One per run, so the per-host rate limit holds across calls to run() and the session's pools are sized once
+        if self._async_fetcher is None:
+            self._async_fetcher = AsyncFetcher(self.scraper,
+                                               max_connections=self.max_workers,
+                                               timeout=self.request_timeout,
+                                               retry_policy=self.retry_policy,
+                                               circuit_breaker=self.circuit_breaker,
+                                               get=self.get_page)
+        return self._async_fetcher
+
     def main(self):
         ap = argparse.ArgumentParser()
         self.define_options(ap)
@@ -0,0 +1,94 @@
+"""
+RetryPolicy's shared retry loop, and the blocked-run check the scrapers stop on.
+
+    python -m pytest directory_issues/scrapers/utils/test_retry.py
+"""
+import asyncio
+
+from .retry import CircuitBreaker, HTTPStatusError, RetryableHTTPError, RetryPolicy
+
+HOST = "example.com"
+
+
+def crawl(policy, breaker, attempt, sources=50):
+    # The shape of the scrapers' crawl loops: keep going through the sources until the policy gives up
+    calls = 0
+    for _ in range(sources):
+        # A regression would otherwise sit out the breaker's pause instead of failing
+        assert breaker.remaining_pause(HOST) == 0, "crawl ran on into the circuit breaker's pause"
+        calls += 1
+        if policy.call(attempt, HOST, breaker) is None and policy.exhausted():
+            break
+    return calls
+
+
+def blocked():
+    raise HTTPStatusError(403, f"https://{HOST}/")
+
+
+def test_repeated_blocks_end_the_crawl():
+    policy = RetryPolicy(max_retries=3, base_delay=0, retry_budget=100, max_blocked=5)
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=300)
+
+    assert crawl(policy, breaker, blocked) == 5
+    assert policy.exhausted()
+    # Blocks aren't retried, so none of the budget went on them
+    assert policy.retries == 0
+
+
+def test_blocks_must_be_consecutive():
+    policy = RetryPolicy(max_retries=1, base_delay=0, max_blocked=3)
+    breaker = CircuitBreaker(failure_threshold=100)
+    outcomes = iter(["403", "403", "page", "403", "403", "page"])
+
+    def attempt():
+        if next(outcomes) == "403":
+            blocked()
+        return "parsed"
+
+    for _ in range(6):
+        policy.call(attempt, HOST, breaker)
+        assert not policy.exhausted()
+
+
+def test_not_found_is_not_a_block():
+    policy = RetryPolicy(max_retries=1, base_delay=0, max_blocked=2)
+    breaker = CircuitBreaker(failure_threshold=100)
+
+    def not_found():
+        raise HTTPStatusError(404, f"https://{HOST}/missing")
+
+    for _ in range(5):
+        assert policy.call(not_found, HOST, breaker) is None
+    assert not policy.exhausted()
+
+
+def test_async_blocks_end_the_crawl():
+    policy = RetryPolicy(max_retries=3, base_delay=0, max_blocked=5)
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=300)
+
+    async def attempt():
+        blocked()
+
+    calls = 0
+    while not policy.exhausted():
+        assert breaker.remaining_pause(HOST) == 0
+        calls += 1
+        assert asyncio.run(policy.call_async(attempt, HOST, breaker)) is None
+    assert calls == 5
+
+
+def test_retryable_errors_spend_the_budget():
+    policy = RetryPolicy(max_retries=3, base_delay=0, retry_budget=4)
+    breaker = CircuitBreaker(failure_threshold=100)
+    attempts = []
+
+    def unavailable():
+        attempts.append(1)
+        raise RetryableHTTPError(503, f"https://{HOST}/")
+
+    assert policy.call(unavailable, HOST, breaker) is None
+    assert len(attempts) == 3
+    assert not policy.exhausted()
+    assert policy.call(unavailable, HOST, breaker) is None
+    assert policy.exhausted()
@@ -1,9 +1,11 @@
 import os
 import logging
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import mediacloud.api as mc_api
 from dotenv import load_dotenv
-from typing import Generator, Optional, List
+from typing import Generator, Optional, List, Tuple, Dict
 from mc_providers import provider_for, PLATFORM_ONLINE_NEWS, PLATFORM_SOURCE_MEDIA_CLOUD
 
 
@@ -11,10 +13,16 @@ logger = logging.getLogger(__name__)
 
 
 class MediaCloudClient:
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None, api_token: Optional[str] = None,
+                 directory_url: Optional[str] = None):
+        """
+        Arguments left as None are read from the environment (or a .env file):
+        MC_ELASTICSEARCH_BASE_URL, MC_API_TOKEN and, optionally, MC_API_BASE_URL for the directory api root.
+        """
         load_dotenv()
-        self.base_url = os.getenv("MC_ELASTICSEARCH_BASE_URL")
-        self.api_token = os.getenv("MC_API_TOKEN")
+        self.base_url = base_url or os.getenv("MC_ELASTICSEARCH_BASE_URL")
+        self.api_token = api_token or os.getenv("MC_API_TOKEN")
+        self.directory_url = directory_url or os.getenv("MC_API_BASE_URL")
 
         if not self.base_url:
             raise ValueError(
@@ -24,6 +32,9 @@ class MediaCloudClient:
             raise ValueError("MC_API_TOKEN environment variable is required")
 
         self.directory_client = mc_api.DirectoryApi(self.api_token)
+        if self.directory_url:
+            self.directory_client.BASE_API_URL = self.directory_url
+        self.source_count = None
         self.provider = self._initialize_provider()
 
     def _initialize_provider(self):
@@ -31,19 +42,119 @@ class MediaCloudClient:
             PLATFORM_ONLINE_NEWS, PLATFORM_SOURCE_MEDIA_CLOUD, base_url=self.base_url
         )
 
+    def _aggregation_search(self, query: str, start_date: dt.datetime, end_date: dt.datetime):
+        # Search with exact hit counting that returns no documents, for aggregation-only queries
+        search = self.provider._basic_search(query, start_date, end_date, source=False)
+        return search.extra(size=0, track_total_hits=True)
+
+    def language_counts(
+        self, query: str, start_date: dt.datetime, end_date: dt.datetime, size: int = 10
+    ) -> Tuple[int, List[Tuple[str, int]]]:
+        """
+        Exact story total and the most common languages (with counts) for a query,
+        from a terms aggregation rather than a sample of matching stories.
+        """
+        search = self._aggregation_search(query, start_date, end_date)
+        search.aggs.bucket("languages", "terms", field="language.keyword", size=size)
+        response = self.provider._search(search, "language_counts")
+        languages = [(bucket["key"], bucket["doc_count"])
+                     for bucket in response.aggregations["languages"]["buckets"]]
+        return response.hits.total.value, languages
+
+    def first_publication_date(
+        self, query: str, start_date: dt.datetime, end_date: dt.datetime
+    ) -> Tuple[int, Optional[dt.datetime]]:
+        """
+        Exact story total and earliest publication_date for a query, from a min aggregation.
+        """
+        search = self._aggregation_search(query, start_date, end_date)
+        search.aggs.metric("first_publication", "min", field="publication_date")
+        response = self.provider._search(search, "first_publication_date")
+        return response.hits.total.value, self._date_from_aggregation(response.aggregations["first_publication"])
+
+    def _per_domain_search(self, domains: List[str], start_date: dt.datetime, end_date: dt.datetime):
+        # Aggregation-only search over an OR of canonical_domains, bucketed back out per domain
+        search = self._aggregation_search(self.provider.everything_query(), start_date, end_date)
+        search = search.filter("terms", canonical_domain=domains)
+        domains_agg = search.aggs.bucket("domains", "terms", field="canonical_domain", size=len(domains))
+        return search, domains_agg
+
+    def language_counts_by_domain(
+        self, domains: List[str], start_date: dt.datetime, end_date: dt.datetime, size: int = 10
+    ) -> Dict[str, Tuple[int, List[Tuple[str, int]]]]:
+        """
+        language_counts for many domains in one query. Domains with no stories are left out.
+        """
+        search, domains_agg = self._per_domain_search(domains, start_date, end_date)
+        domains_agg.bucket("languages", "terms", field="language.keyword", size=size)
+        response = self.provider._search(search, "language_counts_by_domain")
+        return {
+            bucket["key"]: (bucket["doc_count"], [(lang["key"], lang["doc_count"]) for lang in bucket["languages"]["buckets"]])
+            for bucket in response.aggregations["domains"]["buckets"]
+        }
+
+    def first_publication_dates_by_domain(
+        self, domains: List[str], start_date: dt.datetime, end_date: dt.datetime
+    ) -> Dict[str, Tuple[int, Optional[dt.datetime]]]:
+        """
+        first_publication_date for many domains in one query. Domains with no stories are left out.
+        """
+        search, domains_agg = self._per_domain_search(domains, start_date, end_date)
+        domains_agg.metric("first_publication", "min", field="publication_date")
+        response = self.provider._search(search, "first_publication_dates_by_domain")
+        return {
+            bucket["key"]: (bucket["doc_count"], self._date_from_aggregation(bucket["first_publication"]))
+            for bucket in response.aggregations["domains"]["buckets"]
+        }
+
+    @staticmethod
+    def _date_from_aggregation(aggregation) -> Optional[dt.datetime]:
+        value = aggregation.to_dict() if hasattr(aggregation, "to_dict") else aggregation
+        if value.get("value") is None:
+            return None
+        if value.get("value_as_string"):
+            return dt.datetime.fromisoformat(value["value_as_string"][:10])
+        return dt.datetime.fromtimestamp(value["value"] / 1000, tz=dt.timezone.utc).replace(tzinfo=None)
+
     def get_sources(
-        self, platform: Optional[str] = None, batch_size: int = 100, offset: int = 0
+        self, platform: Optional[str] = None, batch_size: int = 100, offset: int = 0, prefetch: bool = True
     ) -> Generator[List[str], None, None]:
-        try:
-            response = self.directory_client.source_list(
-                platform=platform, limit=batch_size, offset=offset
+        """
+        Page through source_list, yielding the names in each batch until the directory is exhausted.
+        With prefetch, the next page is requested in the background while the caller works on the current one.
+        The directory size reported by the first page is kept on self.source_count.
+        """
+
+        def fetch(page_offset):
+            return self.directory_client.source_list(
+                platform=platform, limit=batch_size, offset=page_offset
             )
-            sources = [source["name"] for source in response.get("results", [])]
-            yield sources
 
-            offset += batch_size
-            print(f"Fetched batch of {len(sources)} sources. Total offset: {offset}")
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            response = fetch(offset)
+            self.source_count = response.get("count", 0)
+            while True:
+                results = response.get("results", [])
+                has_next = response.get("next") is not None and len(results) > 0
+                offset += len(results)
+
+                next_page = None
+                if has_next and executor is not None:
+                    next_page = executor.submit(fetch, offset)
+
+                sources = [source["name"] for source in results]
+                logger.info(f"Fetched batch of {len(sources)} sources. Total offset: {offset}")
+                if sources:
+                    yield sources
+
+                if not has_next:
+                    break
+                response = next_page.result() if next_page is not None else fetch(offset)
 
         except Exception as e:
-            print(f"Error fetching sources: {str(e)}")
+            logger.error(f"Error fetching sources: {str(e)}")
             raise
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
@@ -5,75 +5,271 @@ from datetime import datetime, timezone, timedelta
 
 import pandas as pd
 import logging
-from typing import Optional, Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any, Dict, Iterator, List
 from directory_issues.scripts.client import MediaCloudClient
+from directory_issues.scrapers.utils.database import SQLiteMixin
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 CACHE_DIR = '/tmp/directory_issues'
 HOURS_TO_CACHE = 5 # Hours
+# Sources analyzed between writes to the results csv and checkpoint
+RECORD_EVERY = 50
+
+
+class SourcesCheckpoint(SQLiteMixin):
+    """
+    Progress of a SourcesBase run, kept in a local SQLite file so an interrupted run can resume:
+    the offset of the last completed batch, and the status of every source analyzed so far.
+    """
+
+    def __init__(self, database_path: str, run_name: str):
+        self.DATABASE_PATH = database_path
+        self.run_name = run_name
+        self.create_table('progress', {
+            'run_name': 'TEXT PRIMARY KEY',
+            'last_offset': 'INTEGER NOT NULL DEFAULT 0',
+            'last_batch': 'INTEGER NOT NULL DEFAULT 0',
+            'updated_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+        })
+        self.create_table('source_status', {
+            'run_name': 'TEXT NOT NULL',
+            'source': 'TEXT NOT NULL',
+            'status': "TEXT CHECK (status IN ('completed', 'no_result', 'failed')) NOT NULL",
+            'result': 'TEXT DEFAULT NULL',
+            'updated_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
+            'PRIMARY KEY': '(run_name, source)'
+        })
+
+    def get_progress(self) -> Dict[str, int]:
+        rows = self.select('progress', where='run_name = ?', params=(self.run_name,))
+        if not rows:
+            return {"last_offset": 0, "last_batch": 0}
+        return {"last_offset": rows[0]["last_offset"], "last_batch": rows[0]["last_batch"]}
+
+    def save_progress(self, last_offset: int, last_batch: int):
+        self.bulk_insert('progress', [{
+            "run_name": self.run_name,
+            "last_offset": last_offset,
+            "last_batch": last_batch
+        }], "REPLACE")
+
+    def analyzed_sources(self, sources: List[str]) -> set:
+        """
+        The subset of sources which already have a final status in this run. Failed sources are retried.
+        """
+        analyzed = set()
+        #Stay well under sqlite's limit on query parameters
+        for i in range(0, len(sources), 500):
+            batch = sources[i:i + 500]
+            placeholders = ', '.join(['?'] * len(batch))
+            rows = self.select('source_status', columns=['source'],
+                               where=f"run_name = ? AND status <> 'failed' AND source IN ({placeholders})",
+                               params=(self.run_name, *batch))
+            analyzed.update(row["source"] for row in rows)
+        return analyzed
+
+    def failed_sources(self) -> List[str]:
+        return [row["source"] for row in self.iter_select('source_status', columns=['source'],
+                                                          where="run_name = ? AND status = 'failed'",
+                                                          params=(self.run_name,))]
+
+    def has_statuses(self) -> bool:
+        return self.count('source_status', where='run_name = ?', params=(self.run_name,)) > 0
+
+    def export_results(self, file_name: str, result_column: str):
+        """
+        Rewrite the results csv from the completed sources recorded here. Results are appended to the csv
+        before their sources are recorded, so this drops any rows from a run which died in between.
+        """
+        rows = self.iter_select('source_status', columns=['source', 'result'],
+                                where="run_name = ? AND status = 'completed'",
+                                params=(self.run_name,), order_by='rowid')
+        with open(file_name, mode='w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["source", result_column])
+            for row in rows:
+                writer.writerow([row["source"], row["result"]])
+
+    def record_statuses(self, statuses: List[dict]):
+        self.bulk_insert('source_status', [{
+            "run_name": self.run_name,
+            "source": status["source"],
+            "status": status["status"],
+            "result": None if status["result"] is None else str(status["result"])
+        } for status in statuses], "REPLACE")
+
+    def reset(self):
+        self.delete('progress', 'run_name = ?', (self.run_name,))
+        self.delete('source_status', 'run_name = ?', (self.run_name,))
 
 
 class SourcesBase:
-    def __init__(self, client: MediaCloudClient):
+    def __init__(self, client: MediaCloudClient, max_workers: int = 1):
         self.client = client
         self.result_column = "result"
+        # Number of sources analyzed in parallel within a batch
+        self.max_workers = max_workers
+        # Number of domains per analyze_sources call, for subclasses that implement it
+        self.domains_per_query = 100
+        self.record_every = RECORD_EVERY
+        self.checkpoint: Optional[SourcesCheckpoint] = None
 
     def process_sources(
             self,
             platform: Optional[str] = None,
             batch_size: int = 100,
             file_name: Optional[str] = None,
+            max_workers: Optional[int] = None,
+            resume: bool = True,
     ):
+        """
+        Analyze every source in the directory, appending results to {file_name}_results.csv.
+        Progress is checkpointed to {file_name}_checkpoint.db: every source's status as it is analyzed
+        (record_every at a time), and the offset after each batch. With resume, a rerun first retries
+        the sources that failed, then starts from the last completed batch, skipping sources already analyzed.
+        """
+        if max_workers is not None:
+            self.max_workers = max_workers
+
+        file_name = file_name or "sources"
+        results_file = f"{file_name}_results.csv"
+        self.checkpoint = SourcesCheckpoint(f"{file_name}_checkpoint.db", file_name)
+
+        if resume:
+            progress = self.checkpoint.get_progress()
+            if self.checkpoint.has_statuses():
+                self.checkpoint.export_results(results_file, self.result_column)
+            failed = self.checkpoint.failed_sources()
+            if failed:
+                logger.info(f"Retrying {len(failed)} sources which failed in earlier runs")
+                self._analyze_and_record(failed, results_file)
+        else:
+            self.checkpoint.reset()
+            if os.path.exists(results_file):
+                os.remove(results_file)
+            progress = {"last_offset": 0, "last_batch": 0}
+
+        offset = progress["last_offset"]
+        if offset > 0:
+            logger.info(f"Resuming from offset {offset} (batch {progress['last_batch']})")
+
         sources_generator = self.client.get_sources(
-            platform=platform, batch_size=batch_size
+            platform=platform, batch_size=batch_size, offset=offset
         )
 
-        total_sources = None
-        processed_sources = 0
+        processed_sources = offset
 
-        for batch_number, sources in enumerate(sources_generator, start=1):
-            if total_sources is None:
-                response = self.client.directory_client.source_list(
-                    platform=platform, limit=1
-                )
-                total_sources = response.get("count", 0)
+        for batch_number, sources in enumerate(sources_generator, start=progress["last_batch"] + 1):
+            total_sources = self.client.source_count
+            if batch_number == progress["last_batch"] + 1:
                 logger.info(f"Total sources to process: {total_sources}")
 
-            batch_results = self._process_source_batch(sources)
-            self._save_batch_results_to_csv(
-                batch_results, batch_number, file_name or "sources"
-            )
+            done = self.checkpoint.analyzed_sources(sources)
+            pending = [source for source in sources if source not in done]
+            if done:
+                logger.info(f"Skipping {len(done)} sources already analyzed")
+
+            self._analyze_and_record(pending, results_file)
+
             processed_sources += len(sources)
+            self.checkpoint.save_progress(processed_sources, batch_number)
             logger.info(f"Processed {processed_sources}/{total_sources} sources")
 
-            if processed_sources >= total_sources:
-                break
+    def _analyze_source_safely(self, source: str) -> dict:
+        try:
+            result = self.analyze_source(source)
+        except Exception as e:
+            logger.exception(e)
+            return {"source": source, "status": "failed", "result": None}
+
+        if result is None:
+            return {"source": source, "status": "no_result", "result": None}
+        return {"source": source, "status": "completed", "result": result}
+
+    def _analyze_domain_group_safely(self, domains: List[str]) -> List[dict]:
+        try:
+            results = self.analyze_sources(domains)
+        except Exception as e:
+            logger.warning(f"Batch analysis of {len(domains)} domains failed, analyzing them one at a time: {e}")
+            return [self._analyze_source_safely(domain) for domain in domains]
+
+        statuses = []
+        for domain in domains:
+            result = results.get(domain)
+            if result is None:
+                statuses.append({"source": domain, "status": "no_result", "result": None})
+            else:
+                statuses.append({"source": domain, "status": "completed", "result": result})
+        return statuses
+
+    def _analyze_and_record(self, sources: List[str], results_file: str):
+        """
+        Analyze sources, writing results and statuses record_every sources at a time as they finish,
+        so an interrupted batch keeps the work already done. Results are appended to the csv before
+        their sources are marked analyzed, so a source is never skipped on resume without its result.
+        """
+        statuses = []
+        for group in self._iter_analyze_source_batch(sources):
+            statuses += group
+            if len(statuses) >= self.record_every:
+                self._record_statuses(statuses, results_file)
+                statuses = []
+        self._record_statuses(statuses, results_file)
+
+    def _record_statuses(self, statuses: List[dict], results_file: str):
+        if not statuses:
+            return
+        self._append_results_to_csv([{"source": s["source"], self.result_column: s["result"]}
+                                     for s in statuses if s["status"] == "completed"], results_file)
+        self.checkpoint.record_statuses(statuses)
+
+    def _iter_analyze_source_batch(self, sources: List[str]) -> Iterator[List[dict]]:
+        """
+        Analyze a batch of sources, fanning the work out over max_workers threads.
+        Subclasses implementing analyze_sources get one query per group of domains_per_query domains,
+        otherwise analyze_source is called per domain. Yields the statuses of each domain or group, in order.
+        """
+        if self.supports_batch_analysis():
+            groups = [sources[i:i + self.domains_per_query] for i in range(0, len(sources), self.domains_per_query)]
+            work, items = self._analyze_domain_group_safely, groups
+        else:
+            work, items = (lambda source: [self._analyze_source_safely(source)]), sources
+
+        if self.max_workers <= 1:
+            for item in items:
+                yield work(item)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            yield from executor.map(work, items)
+        finally:
+            # On an interrupt, don't keep analyzing the rest of the batch
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _analyze_source_batch(self, sources: List[str]) -> List[dict]:
+        """
+        The status of every source in a batch, in order.
+        """
+        return [status for group in self._iter_analyze_source_batch(sources) for status in group]
 
     def _process_source_batch(self, sources: List[str]) -> List[dict]:
         """
         Process a batch of sources and collect results.
         """
-        batch_results = []
-        for source in sources:
-            try:
-                result = self.analyze_source(source)
-                if result is not None:
-                    batch_results.append({"source": source, self.result_column: result})
-            except Exception as e:
-                logger.exception(e)
+        return [{"source": s["source"], self.result_column: s["result"]}
+                for s in self._analyze_source_batch(sources) if s["status"] == "completed"]
 
-        return batch_results
-
-    def _save_batch_results_to_csv(
+    def _append_results_to_csv(
             self,
             batch_results: List[dict],
-            batch_number: int,
             file_name: str,
     ):
         """
-        Save batch results to a CSV file with error handling.
+        Append batch results to the consolidated results CSV, writing the header on first use.
         """
         if not batch_results:
             return
@@ -81,7 +277,7 @@ class SourcesBase:
         try:
             batch_df = pd.DataFrame(batch_results)
             batch_df.to_csv(
-                f"{file_name}_results_batch_{batch_number}.csv", index=False
+                file_name, mode='a', index=False, header=not os.path.exists(file_name)
             )
         except Exception as e:
             logger.exception(e)
@@ -89,6 +285,16 @@ class SourcesBase:
     def analyze_source(self, domain: str):
         raise NotImplementedError("Subclasses must implement this method.")
 
+    def analyze_sources(self, domains: List[str]) -> Dict[str, Any]:
+        """
+        Optionally override in subclasses to analyze many domains with one query.
+        Return {domain: result}; domains left out (or mapped to None) have no result.
+        """
+        raise NotImplementedError("Subclasses may implement this method.")
+
+    def supports_batch_analysis(self) -> bool:
+        return type(self).analyze_sources is not SourcesBase.analyze_sources
+
 
 class CollectionsBase:
     def __init__(self, client: MediaCloudClient):
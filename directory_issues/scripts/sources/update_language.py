@@ -1,7 +1,8 @@
+import argparse
 import logging
 import datetime as dt
 import pandas as pd
-from typing import Optional, List
+from typing import Optional, List, Dict
 from directory_issues.scripts.sources.base import SourcesBase, MediaCloudClient
 
 logger = logging.getLogger(__name__)
@@ -9,8 +10,8 @@ logger = logging.getLogger(__name__)
 DAYS_BACK = 365
 
 class SourceLanguage(SourcesBase):
-    def __init__(self, client):
-        super().__init__(client)
+    def __init__(self, client, max_workers: int = 1):
+        super().__init__(client, max_workers=max_workers)
         self.result_column = "primary_language"
 
     def analyze_source(self, domain: str, min_story_count: int = 100) -> Optional[str]:
@@ -28,20 +29,42 @@ class SourceLanguage(SourcesBase):
         start_date = dt.datetime.now() - dt.timedelta(days=DAYS_BACK)
         end_date = dt.datetime.now()
 
-        results = self.client.provider._overview_query(query, start_date, end_date)
+        total, languages = self.client.language_counts(query, start_date, end_date, size=1)
 
-        if results["total"] <= min_story_count or self.client.provider._is_no_results(
-            results
-        ):
+        if total <= min_story_count or not languages:
             return None
 
-        languages = [match["language"] for match in results["matches"]]
-        return max(set(languages), key=languages.count)
+        return languages[0][0]
+
+    def analyze_sources(self, domains: List[str], min_story_count: int = 100) -> Dict[str, str]:
+        """
+        Primary language for many domains at once, with the same threshold as analyze_source.
+        """
+        start_date = dt.datetime.now() - dt.timedelta(days=DAYS_BACK)
+        end_date = dt.datetime.now()
+
+        counts = self.client.language_counts_by_domain(domains, start_date, end_date, size=1)
+
+        return {
+            domain: languages[0][0]
+            for domain, (total, languages) in counts.items()
+            if total > min_story_count and languages
+        }
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the primary language of every online news source.")
+    parser.add_argument(
+        '--no-resume',
+        action='store_false',
+        dest="resume",
+        help="Start a fresh backfill instead of resuming the last one. Progress is checkpointed to "
+             "language_checkpoint.db in the working directory, and results written to language_results.csv"
+    )
+    args = parser.parse_args()
+
     client = MediaCloudClient()
-    lang_analyzer = SourceLanguage(client)
+    lang_analyzer = SourceLanguage(client, max_workers=8)
     lang_results = lang_analyzer.process_sources(
-        platform="online_news", batch_size=10000, file_name="language"
+        platform="online_news", batch_size=10000, file_name="language", resume=args.resume
     )
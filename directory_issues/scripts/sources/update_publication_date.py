@@ -1,5 +1,6 @@
+import argparse
 import datetime as dt
-from typing import Optional
+from typing import Optional, List, Dict
 from directory_issues.scripts.sources.base import SourcesBase, MediaCloudClient
 
 # Set earliest ingest date to 2000
@@ -9,8 +10,8 @@ START_DATE_DAY = 1
 
 
 class SourcesPublicationDate(SourcesBase):
-    def __init__(self, client):
-        super().__init__(client)
+    def __init__(self, client, max_workers: int = 1):
+        super().__init__(client, max_workers=max_workers)
         self.result_column = "first_publication_date"
 
     def analyze_source(
@@ -21,23 +22,42 @@ class SourcesPublicationDate(SourcesBase):
         start_date = dt.datetime(START_DATE_YEAR, START_DATE_MONTH, START_DATE_DAY)
         end_date = dt.datetime.now()
 
-        results = self.client.provider._overview_query(query, start_date, end_date)
+        total, first_publication_date = self.client.first_publication_date(query, start_date, end_date)
 
-        if results["total"] <= min_story_count or self.client.provider._is_no_results(
-            results
-        ):
+        if total <= min_story_count:
             return None
 
-        publication_dates = [
-            dt.datetime.fromisoformat(match["publication_date"])
-            for match in results["matches"]
-        ]
-        return min(publication_dates, default=None)
+        return first_publication_date
+
+    def analyze_sources(
+        self, domains: List[str], min_story_count: int = 100
+    ) -> Dict[str, dt.datetime]:
+        """First publication date for many domains at once."""
+        start_date = dt.datetime(START_DATE_YEAR, START_DATE_MONTH, START_DATE_DAY)
+        end_date = dt.datetime.now()
+
+        dates = self.client.first_publication_dates_by_domain(domains, start_date, end_date)
+
+        return {
+            domain: first_publication_date
+            for domain, (total, first_publication_date) in dates.items()
+            if total > min_story_count
+        }
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the first publication date of every online news source.")
+    parser.add_argument(
+        '--no-resume',
+        action='store_false',
+        dest="resume",
+        help="Start a fresh backfill instead of resuming the last one. Progress is checkpointed to "
+             "publication_date_checkpoint.db in the working directory, and results written to publication_date_results.csv"
+    )
+    args = parser.parse_args()
+
     client = MediaCloudClient()
-    pub_date_analyzer = SourcesPublicationDate(client)
+    pub_date_analyzer = SourcesPublicationDate(client, max_workers=8)
     pub_results = pub_date_analyzer.process_sources(
-        platform="online_news", batch_size=10000, file_name="publication_date"
+        platform="online_news", batch_size=10000, file_name="publication_date", resume=args.resume
     )